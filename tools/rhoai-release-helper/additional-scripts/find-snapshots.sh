@@ -85,18 +85,14 @@ RBC_RELEASE_DIR=${workspace}/RBC_${release_branch}_commit
 V417_CATALOG_YAML_PATH=catalog/v4.17/rhods-operator/catalog.yaml
 CATALOG_YAML_PATH=${RBC_RELEASE_DIR}/${V417_CATALOG_YAML_PATH}
 expected_rhoai_images_file_path=${workspace}/expected_rhoai_images.json
-#python release_processor.py --operation extract-rhoai-images-from-catalog --catalog-yaml-path ${CATALOG_YAML_PATH} --rhoai-version ${rhoai_version} --output-file-path ${expected_rhoai_images_file_path}
+python release_processor.py --operation extract-rhoai-images-from-catalog --catalog-yaml-path ${CATALOG_YAML_PATH} --rhoai-version ${rhoai_version} --output-file-path ${expected_rhoai_images_file_path}
 
-component_application_snapshots_path=${workspace}/component_application_snapshots.txt
-oc get snapshots -l "pac.test.appstudio.openshift.io/event-type in (push, Push),appstudio.openshift.io/application=${component_application}" --sort-by=.metadata.creationTimestamp --no-headers | awk '{print $1}' | tac > ${component_application_snapshots_path}
-
-
-oc get snapshot ${snapshot_name} -o=jsonpath='{range .spec.components[*]}{.containerImage}{"\n"}{end}' | jq -s -R 'split("\n")' > ${snapshot_file_path}
-
-while read snapshot_name; do
-  snapshot_file_path=${workspace}/${snapshot_name}.json
-  oc get snapshot ${snapshot_name} -o=jsonpath='{.spec.components[*].containerImage}' | jq -s -R 'split(" ")' > ${snapshot_file_path}
-  python release_processor.py --operation check-snapshot-compatibility --snapshot-file-path ${workspace}/${snapshot_name}.json --expected-rhoai-images-file-path ${expected_rhoai_images_file_path} --snapshot-name ${snapshot_name}
-  compatible=$(jq -r '.compatible' ${snapshot_file_path})
-  if [[ $compatible == YES ]]; then echo "${snapshot_name} is the correct snapshot to push to stage!"; exit; fi
-done <${component_application_snapshots_path}
\ No newline at end of file
+# search all the push snapshots, newest first, in a single process which stops at the first compatible one
+compatible_snapshot_path=${workspace}/compatible_snapshot.json
+if oc get snapshots -l "pac.test.appstudio.openshift.io/event-type in (push, Push),appstudio.openshift.io/application=${component_application}" -o json \
+  | jq -c '.items | sort_by(.metadata.creationTimestamp) | reverse | .[] | {snapshot_name: .metadata.name, images: [.spec.components[].containerImage]}' \
+  | python release_processor.py --operation find-compatible-snapshot --expected-rhoai-images-file-path ${expected_rhoai_images_file_path} --output-file-path ${compatible_snapshot_path}
+then
+  snapshot_name=$(jq -r '.snapshot_name' ${compatible_snapshot_path})
+  echo "${snapshot_name} is the correct snapshot to push to stage!"
+fi
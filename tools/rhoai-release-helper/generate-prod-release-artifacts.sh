@@ -207,8 +207,6 @@ echo "starting to create the artifacts corresponding to the sourcecode at ${RBC_
 
 
 RBC_RELEASE_DIR=${workspace}/RBC_${release_branch}_commit
-V416_CATALOG_YAML_PATH=catalog/v4.16/rhods-operator/catalog.yaml
-CATALOG_YAML_PATH=${RBC_RELEASE_DIR}/${V416_CATALOG_YAML_PATH}
 
 mkdir -p ${RBC_RELEASE_DIR}
 cd ${RBC_RELEASE_DIR}
@@ -218,8 +216,18 @@ git remote add origin $RBC_URL
 git config core.sparseCheckout true
 git config core.sparseCheckoutCone false
 mkdir -p .git/info
-echo "${V416_CATALOG_YAML_PATH}" >> .git/info/sparse-checkout
 git fetch -q --depth=1 origin ${RBC_RELEASE_BRANCH_COMMIT}
+# the build config of the release commit, the supported ocp versions of the branch head may have changed since
+echo "config/build-config.yaml" >> .git/info/sparse-checkout
+BUILD_CONFIG_PATH=${RBC_RELEASE_DIR}/config/build-config.yaml
+ocp_versions_array=()
+while IFS= read -r version; do
+  ocp_versions_array+=("$version")
+done < <(git show ${RBC_RELEASE_BRANCH_COMMIT}:config/build-config.yaml | yq eval '.config.supported-ocp-versions.release[]' -)
+# catalogs of all the supported ocp versions, validated together against the snapshot
+for ocp_version in "${ocp_versions_array[@]}"; do
+  echo "catalog/${ocp_version}/rhods-operator/catalog.yaml" >> .git/info/sparse-checkout
+done
 git checkout -q ${RBC_RELEASE_BRANCH_COMMIT}
 cd ${current_dir}
 
@@ -229,7 +237,7 @@ SNAPSHOT_YAML_PATH=${workspace}/${components_snapshot_name}.yaml
 oc get snapshot ${components_snapshot_name} -o yaml > ${SNAPSHOT_YAML_PATH}
 kubectl get components -o=jsonpath="{range .items[?(@.spec.application=='${component_application}')]}{@.metadata.name}{'\t'}{@.spec.containerImage}{'\n'}{end}" > ${RHOAI_KONFLUX_COMPONENTS_DETAILS_FILE_PATH}
 
-python release_processor.py --operation validate-snapshot-with-catalog --catalog-yaml-path ${CATALOG_YAML_PATH} --konflux-components-details-file-path ${RHOAI_KONFLUX_COMPONENTS_DETAILS_FILE_PATH} --rhoai-version ${rhoai_version} --rhoai-application ${component_application} --snapshot-file-path ${SNAPSHOT_YAML_PATH}
+python release_processor.py --operation validate-snapshot-with-catalog --build-config-path ${BUILD_CONFIG_PATH} --rbc-dir ${RBC_RELEASE_DIR} --konflux-components-details-file-path ${RHOAI_KONFLUX_COMPONENTS_DETAILS_FILE_PATH} --rhoai-version ${rhoai_version} --rhoai-application ${component_application} --snapshot-file-path ${SNAPSHOT_YAML_PATH}
 
 components_release_yaml_path=${release_components_dir}/prod-release-components-${component_application}-${epoch}.yaml
 
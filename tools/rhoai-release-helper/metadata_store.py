@@ -0,0 +1,107 @@
+import argparse
+import json
+import os
+import sqlite3
+import sys
+import threading
+import time
+
+
+DEFAULT_DB_PATH = os.path.join(os.path.expanduser('~'), '.cache', 'rhoai-release-helper', 'image-metadata.db')
+# bumped on every change of the images table, a store with another version is dropped and filled again
+SCHEMA_VERSION = 2
+
+class metadata_store:
+    # git labels of the images keyed by the digest of the image, shared by all the runs of release_processor on a machine
+    # a digest is immutable, so an entry stays valid until it is pruned
+    # the signed state isn't stored, release_processor checks the signature of every image on every run
+    def __init__(self, db_path:str=DEFAULT_DB_PATH):
+        self.db_path = db_path
+        if os.path.dirname(db_path):
+            os.makedirs(os.path.dirname(db_path), exist_ok=True)
+        self.lock = threading.Lock()
+        # WAL lets concurrent runs read while one of them writes
+        self.connection = sqlite3.connect(db_path, timeout=30, check_same_thread=False)
+        self.connection.execute('PRAGMA journal_mode=WAL')
+        if self.connection.execute('PRAGMA user_version').fetchone()[0] != SCHEMA_VERSION:
+            self.connection.execute('DROP TABLE IF EXISTS images')
+            self.connection.execute(f'PRAGMA user_version={SCHEMA_VERSION}')
+        self.connection.execute('''CREATE TABLE IF NOT EXISTS images (
+                                    org TEXT NOT NULL,
+                                    repo TEXT NOT NULL,
+                                    digest TEXT NOT NULL,
+                                    git_url TEXT,
+                                    git_commit TEXT,
+                                    created_at REAL NOT NULL,
+                                    last_used_at REAL NOT NULL,
+                                    PRIMARY KEY (org, repo, digest))''')
+        self.connection.commit()
+
+    def row_to_dict(self, row):
+        return {'org': row[0], 'repo': row[1], 'digest': row[2], 'git_url': row[3], 'git_commit': row[4],
+                'created_at': row[5], 'last_used_at': row[6]}
+
+    def get(self, org, repo, digest):
+        with self.lock:
+            row = self.connection.execute('SELECT * FROM images WHERE org=? AND repo=? AND digest=?', (org, repo, digest)).fetchone()
+            if row:
+                self.connection.execute('UPDATE images SET last_used_at=? WHERE org=? AND repo=? AND digest=?', (time.time(), org, repo, digest))
+                self.connection.commit()
+        return self.row_to_dict(row) if row else None
+
+    def put(self, org, repo, digest, git_url, git_commit):
+        now = time.time()
+        with self.lock:
+            self.connection.execute('INSERT OR REPLACE INTO images VALUES (?, ?, ?, ?, ?, ?, ?)',
+                                    (org, repo, digest, git_url, git_commit, now, now))
+            self.connection.commit()
+
+    def list(self, org=None, repo=None):
+        query = 'SELECT * FROM images WHERE (? IS NULL OR org=?) AND (? IS NULL OR repo=?) ORDER BY org, repo, last_used_at DESC'
+        with self.lock:
+            rows = self.connection.execute(query, (org, org, repo, repo)).fetchall()
+        return [self.row_to_dict(row) for row in rows]
+
+    def prune(self, older_than_days:float):
+        # drops the entries not used for the given number of days
+        with self.lock:
+            cursor = self.connection.execute('DELETE FROM images WHERE last_used_at < ?', (time.time() - older_than_days * 24 * 3600,))
+            self.connection.commit()
+        with self.lock:
+            self.connection.execute('VACUUM')
+        return cursor.rowcount
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Inspect and prune the image metadata store of release_processor')
+    parser.add_argument('-db', '--metadata-store', required=False, default=DEFAULT_DB_PATH,
+                        help='Path of the sqlite image metadata store', dest='metadata_store')
+    parser.add_argument('-op', '--operation', required=True, choices=['inspect', 'stats', 'prune'],
+                        help='inspect - print the entries as json, stats - print the number of entries per org/repo, prune - drop the entries not used recently', dest='operation')
+    parser.add_argument('-o', '--org', required=False, help='Only inspect the entries of this org', dest='org')
+    parser.add_argument('-r', '--repo', required=False, help='Only inspect the entries of this repo', dest='repo')
+    parser.add_argument('-d', '--older-than-days', required=False, type=float, default=30,
+                        help='Prune the entries not used for this many days', dest='older_than_days')
+    args = parser.parse_args()
+
+    if not os.path.exists(args.metadata_store):
+        print(f'metadata store not found - {args.metadata_store}')
+        sys.exit(1)
+
+    store = metadata_store(args.metadata_store)
+    if args.operation == 'inspect':
+        json.dump(store.list(args.org, args.repo), sys.stdout, indent=4)
+        print()
+    elif args.operation == 'stats':
+        counts = {}
+        for entry in store.list(args.org, args.repo):
+            counts[f'{entry["org"]}/{entry["repo"]}'] = counts.get(f'{entry["org"]}/{entry["repo"]}', 0) + 1
+        for repo, count in counts.items():
+            print(f'{repo}\t{count}')
+        print(f'total\t{sum(counts.values())}')
+    elif args.operation == 'prune':
+        print(f'pruned {store.prune(args.older_than_days)} entries not used for {args.older_than_days} days')
+    store.close()
@@ -122,7 +122,9 @@ echo "--output-dir ${release_artifacts_dir}"
 echo "--template-dir ${template_dir}"
 echo "--rbc-release-commit ${RBC_RELEASE_BRANCH_COMMIT}"
 echo "-----------------------------------------------------------------------------------------"
-RHOAI_QUAY_API_TOKEN=${RHOAI_QUAY_API_TOKEN} python release_processor.py --operation generate-release-artifacts --catalog-yaml-path ${CATALOG_YAML_PATH} --konflux-components-details-file-path ${RHOAI_KONFLUX_COMPONENTS_DETAILS_FILE_PATH} --rhoai-version ${rhoai_version} --rhoai-application ${component_application} --epoch ${epoch} --output-dir ${release_artifacts_dir} --template-dir ${template_dir} --rbc-release-commit ${RBC_RELEASE_BRANCH_COMMIT}
+# metadata of signed images, reused across runs as most of them carry over unchanged between nightlies
+METADATA_STORE_PATH=${METADATA_STORE_PATH:-${HOME}/.cache/rhoai-release-helper/image-metadata.db}
+RHOAI_QUAY_API_TOKEN=${RHOAI_QUAY_API_TOKEN} python release_processor.py --operation generate-release-artifacts --catalog-yaml-path ${CATALOG_YAML_PATH} --konflux-components-details-file-path ${RHOAI_KONFLUX_COMPONENTS_DETAILS_FILE_PATH} --rhoai-version ${rhoai_version} --rhoai-application ${component_application} --epoch ${epoch} --output-dir ${release_artifacts_dir} --template-dir ${template_dir} --rbc-release-commit ${RBC_RELEASE_BRANCH_COMMIT} --metadata-store ${METADATA_STORE_PATH}
 echo
 echo ">> Artifacts Generated Successfully!"
 echo
@@ -1,12 +1,18 @@
 import argparse
+import functools
+import hashlib
 import json
 import sys
 import os
-import requests
+import re
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 
 import yaml
-import ruamel.yaml as ruyaml
-from collections import defaultdict
+from collections import defaultdict, OrderedDict
+from metadata_store import metadata_store
+# the quay api client shared with utils/quay-cleaner, imported by get_quay_client on first use
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'utils', 'quay-client'))
 class release_processor:
     OPERATOR_NAME = 'rhods-operator'
     PRODUCTION_REGISTRY = 'registry.redhat.io'
@@ -14,32 +20,46 @@ class release_processor:
     RHOAI_NAMESPACE = 'rhoai'
     GIT_URL_LABEL_KEY = 'git.url'
     GIT_COMMIT_LABEL_KEY = 'git.commit'
-    def __init__(self, catalog_yaml_path:str, konflux_components_details_file_path:str, rhoai_version:str, output_dir:str, rhoai_application:str, epoch, template_dir:str, rbc_release_commit:str, snapshot_file_path:str=''):
+    DEFAULT_MAX_WORKERS = 8
+    DEFAULT_CATALOG_CACHE_DIR = os.path.join(os.path.expanduser('~'), '.cache', 'rhoai-release-helper', 'catalog-index')
+    CATALOG_TOP_LEVEL_KEY_PATTERN = re.compile(r'^(schema|name):\s*(.*?)\s*$')
+    FBC_APPLICATION_PREFIX = 'rhoai-fbc-fragment-ocp-'
+    def __init__(self, catalog_yaml_path:str, konflux_components_details_file_path:str, rhoai_version:str, output_dir:str, rhoai_application:str, epoch, template_dir:str, rbc_release_commit:str, snapshot_file_path:str='', max_workers:int=DEFAULT_MAX_WORKERS, metadata_store_path:str='', catalog_parser:str='fast', catalog_cache_dir:str=DEFAULT_CATALOG_CACHE_DIR, prod_template_dir:str='', image_sources:dict=None):
         self.catalog_yaml_path = catalog_yaml_path
-        self.catalog_dict:defaultdict = self.parse_catalog_yaml()
         self.konflux_components_details_file_path = konflux_components_details_file_path
         self.rhoai_version = rhoai_version
         self.output_dir = output_dir
         self.release_components_dir = f'{self.output_dir}/release-components'
         self.snapshot_components_dir = f'{self.output_dir}/snapshot-components'
+        self.release_fbc_dir = f'{self.output_dir}/release-fbc'
+        self.snapshot_fbc_dir = f'{self.output_dir}/snapshot-fbc'
         self.current_operator = f'{self.OPERATOR_NAME}.{self.rhoai_version}'
-        self.konflux_components = self.parse_konflux_components_details()
+        self.catalog_parser = catalog_parser
+        self.catalog_cache_dir = catalog_cache_dir
+        self.catalog_dict:defaultdict = self.parse_catalog_yaml() if self.catalog_yaml_path else defaultdict(dict)
+        self.konflux_components = self.parse_konflux_components_details() if self.konflux_components_details_file_path else {}
         self.rhoai_application = rhoai_application
         self.epoch = str(epoch)
         self.template_dir = template_dir
-        self.hyphenized_rhoai_version = self.rhoai_application.replace('rhoai-', '')
+        self.prod_template_dir = prod_template_dir
+        self.hyphenized_rhoai_version = (self.rhoai_application or '').replace('rhoai-', '')
         self.rbc_release_commit = rbc_release_commit
         self.replacements = {'component_application': self.rhoai_application, 'epoch': self.epoch, 'hyphenized-rhoai-version':self.hyphenized_rhoai_version, 'rbc_release_commit': self.rbc_release_commit }
         self.snapshot_file_path = snapshot_file_path
+        self.max_workers = max_workers
+        self.metadata_store = metadata_store(metadata_store_path) if metadata_store_path else None
+        # image -> (git url, git commit), shared by the processors of a batch so that each image is looked up once
+        self.image_sources = image_sources if image_sources is not None else {}
 
 
-    def validate_snapshot_with_catalog(self):
+    def validate_snapshot_with_catalog(self, catalog_yaml_paths:dict=None):
+        # catalog_yaml_paths - ocp version -> catalog.yaml, the catalog passed to the constructor if not set
+        # the catalogs are parsed in worker processes, each one is then diffed against the snapshot with sets indexed by repo
         snapshot_dict = yaml.safe_load(open(self.snapshot_file_path))
         snapshot_components = snapshot_dict['spec']['components']
-        catalog_images = self.catalog_dict['olm.bundle'][self.current_operator]['relatedImages']
         konflux_components = {name:repo for repo, name in self.konflux_components.items()}
-        self.extract_rhoai_images_from_catalog()
 
+        snapshot_images = set()
         for component in snapshot_components:
             component_name = component['name']
             if not component['containerImage'].startswith(konflux_components[component_name]):
@@ -47,19 +67,41 @@ class release_processor:
                 sys.exit(1)
             else:
                 print(f'quay repo {konflux_components[component_name]} matches with the konflux component {component_name}!')
+            snapshot_images.add(component['containerImage'])
 
-            if component['containerImage'] not in self.expected_rhoai_images:
-                print(f'snapshot image not found in catalog - {component['containerImage']}')
-            else:
-                print(f'snapshot image found in catalog - {component['containerImage']}!')
-
-
-
-
+        if not catalog_yaml_paths:
+            self.extract_rhoai_images_from_catalog()
+            expected_images_per_catalog = {'': self.expected_rhoai_images}
+        else:
+            with ProcessPoolExecutor(max_workers=min(len(catalog_yaml_paths), os.cpu_count() or 1)) as executor:
+                futures = {ocp_version: executor.submit(extract_expected_rhoai_images, catalog_yaml_path, self.rhoai_version, self.catalog_parser, self.catalog_cache_dir)
+                           for ocp_version, catalog_yaml_path in catalog_yaml_paths.items()}
+                expected_images_per_catalog = {ocp_version: future.result() for ocp_version, future in futures.items()}
+
+        snapshot_digests_by_repo = index_images_by_repo(snapshot_images)
+        for ocp_version, expected_rhoai_images in expected_images_per_catalog.items():
+            expected_rhoai_images = set(expected_rhoai_images)
+            catalog_digests_by_repo = index_images_by_repo(expected_rhoai_images)
+            catalog_name = f'catalog {ocp_version}' if ocp_version else 'catalog'
+            print(f'{catalog_name} - {len(expected_rhoai_images)} rhoai images, {len(snapshot_images & expected_rhoai_images)} of the {len(snapshot_images)} snapshot images found')
+            for image in sorted(snapshot_images - expected_rhoai_images):
+                repo = image.split('@')[0]
+                catalog_digests = ', '.join(sorted(catalog_digests_by_repo.get(repo, []))) or 'none'
+                print(f'  snapshot image not found in {catalog_name} - {image} (catalog digests of the repo - {catalog_digests})')
+            for image in sorted(expected_rhoai_images - snapshot_images):
+                if image.split('@')[0] not in snapshot_digests_by_repo:
+                    print(f'  {catalog_name} image not found in snapshot - {image}')
 
     def parse_catalog_yaml(self):
+        if self.catalog_parser == 'roundtrip':
+            return self.parse_catalog_yaml_roundtrip()
+        return self.parse_catalog_yaml_fast({('olm.bundle', self.current_operator)})
+
+    def parse_catalog_yaml_roundtrip(self):
+        # loads every document of the catalog, slow and memory-heavy on large catalogs but preserves quotes
         # objs = yaml.safe_load_all(open(self.catalog_yaml_path))
         # objs = ruyaml.load_all(open(self.catalog_yaml_path), Loader=ruyaml.RoundTripLoader, preserve_quotes=True)
+        import ruamel.yaml as ruyaml
         YAML = ruyaml.YAML(typ='rt')
         YAML.preserve_quotes = True
         objs = YAML.load_all(open(self.catalog_yaml_path))
@@ -68,6 +110,62 @@ class release_processor:
             catalog_dict[obj['schema']][obj['name']] = obj
         return catalog_dict
 
+    def iter_catalog_documents(self):
+        document = []
+        with open(self.catalog_yaml_path) as catalog:
+            for line in catalog:
+                if line.rstrip() == '---':
+                    if document:
+                        yield document
+                    document = []
+                else:
+                    document.append(line)
+        if document:
+            yield document
+
+    def parse_catalog_yaml_fast(self, selected_entries:set):
+        # only the (schema, name) entries in selected_entries are parsed, every other document of the catalog is skipped
+        # after matching its top-level schema/name lines, the result is cached by the hash of the catalog
+        catalog_hash = hashlib.sha256()
+        with open(self.catalog_yaml_path, 'rb') as catalog:
+            for chunk in iter(lambda: catalog.read(1024 * 1024), b''):
+                catalog_hash.update(chunk)
+        selection_key = json.dumps(sorted(selected_entries))
+        cache_path = os.path.join(self.catalog_cache_dir, f'{catalog_hash.hexdigest()}-{hashlib.sha256(selection_key.encode()).hexdigest()[:16]}.json') if self.catalog_cache_dir else ''
+
+        catalog_dict = defaultdict(dict)
+        if cache_path and os.path.exists(cache_path):
+            try:
+                catalog_dict.update(json.load(open(cache_path)))
+                return catalog_dict
+            except ValueError:
+                pass
+
+        loader = getattr(yaml, 'CSafeLoader', yaml.SafeLoader)
+        for document in self.iter_catalog_documents():
+            top_level_keys = {}
+            for line in document:
+                match = self.CATALOG_TOP_LEVEL_KEY_PATTERN.match(line)
+                if match and match.group(1) not in top_level_keys:
+                    top_level_keys[match.group(1)] = match.group(2).strip('\'"')
+            if 'schema' in top_level_keys and 'name' in top_level_keys:
+                if (top_level_keys['schema'], top_level_keys['name']) not in selected_entries:
+                    continue
+                obj = yaml.load(''.join(document), Loader=loader)
+            else:
+                # schema/name not written as plain top-level lines (e.g. flow style), parse to find out
+                obj = yaml.load(''.join(document), Loader=loader)
+                if not isinstance(obj, dict) or (obj.get('schema'), obj.get('name')) not in selected_entries:
+                    continue
+            catalog_dict[obj['schema']][obj['name']] = obj
+
+        if cache_path:
+            os.makedirs(self.catalog_cache_dir, exist_ok=True)
+            temp_path = f'{cache_path}.{os.getpid()}.tmp'
+            json.dump(catalog_dict, open(temp_path, 'w'), default=str)
+            os.replace(temp_path, cache_path)
+        return catalog_dict
+
     def parse_konflux_components_details(self):
         konflux_components = {}
         components_details = open(self.konflux_components_details_file_path).readlines()
@@ -92,72 +190,207 @@ class release_processor:
         self.generate_component_snapshot()
         self.generate_component_release()
 
-    def generate_component_snapshot(self):
-        snapshot_components = []
-        for image in self.expected_rhoai_images:
-            snapshot_component = {}
-            image_parts = image.split('@')
-            repo_path = image_parts[0]
-            manifest_digest = image_parts[1]
-            parts = repo_path.split('/')
-            registry = parts[0]
-            org = parts[1]
-            repo = '/'.join(parts[2:])
-            qc = quay_controller(org)
-            sig_tag = f'{manifest_digest.replace(":", "-")}.sig'
-            signature = qc.get_tag_details(repo, sig_tag)
-            # signature=True
-            if signature:
-                manifest_json = qc.get_manifest_details(repo, manifest_digest)
-                if manifest_json['is_manifest_list'] == True:
-                    image_manifest_digests = qc.get_image_manifest_digests_for_all_the_supported_archs(repo,
-                                                                                                       manifest_digest)
-                    if image_manifest_digests:
-                        manifest_digest = image_manifest_digests[0]
-
-                labels = qc.get_git_labels(repo, manifest_digest)
-                labels = {label['key']: label['value'] for label in labels if label['value']}
-                git_url = labels[self.GIT_URL_LABEL_KEY]
-                git_commit = labels[self.GIT_COMMIT_LABEL_KEY]
-                snapshot_component['name'] = self.konflux_components[repo_path]
-                snapshot_component['containerImage'] = image
-                snapshot_component['source'] = {'git': {}}
-                snapshot_component['source']['git']['url'] = git_url
-                snapshot_component['source']['git']['revision'] = git_commit
-
-                snapshot_components.append(snapshot_component)
-            else:
-                print(f'Invalid image, could not verify signature of {image}')
-                sys.exit(1)
+    def get_snapshot_component(self, image):
+        snapshot_component = {}
+        image_parts = image.split('@')
+        repo_path = image_parts[0]
+        manifest_digest = image_parts[1]
+        parts = repo_path.split('/')
+        registry = parts[0]
+        org = parts[1]
+        repo = '/'.join(parts[2:])
+        # the signature is checked on every lookup, a signature can be revoked after the image was seen
+        # signatures keeps one listing of the signature tags per repo for the whole run
+        if not signatures.is_signed(org, repo, manifest_digest):
+            # reported with the other unsigned images by generate_component_snapshot
+            return None
+        snapshot_component['name'] = self.konflux_components[repo_path]
+        snapshot_component['containerImage'] = image
+        # git labels of the images already looked up for another target of the batch
+        if image in self.image_sources:
+            git_url, git_commit = self.image_sources[image]
+            snapshot_component['source'] = {'git': {'url': git_url, 'revision': git_commit}}
+            return snapshot_component
+        # or already seen by a previous run, served from the metadata store
+        stored_metadata = self.metadata_store.get(org, repo, manifest_digest) if self.metadata_store else None
+        if stored_metadata:
+            git_url, git_commit = stored_metadata['git_url'], stored_metadata['git_commit']
+            self.image_sources[image] = (git_url, git_commit)
+            snapshot_component['source'] = {'git': {'url': git_url, 'revision': git_commit}}
+            return snapshot_component
+
+        qc = quay_controller(org)
+        image_digest = manifest_digest
+        manifest_json = qc.get_manifest_details(repo, manifest_digest)
+        if manifest_json['is_manifest_list'] == True:
+            image_manifest_digests = qc.get_image_manifest_digests_for_all_the_supported_archs(repo,
+                                                                                               manifest_digest)
+            if image_manifest_digests:
+                manifest_digest = image_manifest_digests[0]
+
+        labels = qc.get_git_labels(repo, manifest_digest)
+        labels = {label['key']: label['value'] for label in labels if label['value']}
+        git_url = labels[self.GIT_URL_LABEL_KEY]
+        git_commit = labels[self.GIT_COMMIT_LABEL_KEY]
+        snapshot_component['source'] = {'git': {}}
+        snapshot_component['source']['git']['url'] = git_url
+        snapshot_component['source']['git']['revision'] = git_commit
+        if self.metadata_store:
+            self.metadata_store.put(org, repo, image_digest, git_url, git_commit)
+        self.image_sources[image] = (git_url, git_commit)
+        return snapshot_component
 
-        component_snapshot = open(f'{self.template_dir}/component_snapshot.yaml').read()
-        for key, value in self.replacements.items():
-            component_snapshot = component_snapshot.replace(f'{{{{{key}}}}}', value)
+    def generate_component_snapshot(self):
+        # the quay lookups of each image run in parallel, map() keeps the components in the catalog order
+        # a sys.exit() in a worker is re-raised here when its result is collected
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            snapshot_components = list(executor.map(self.get_snapshot_component, self.expected_rhoai_images))
+
+        unsigned_images = [image for image, component in zip(self.expected_rhoai_images, snapshot_components) if component is None]
+        if unsigned_images:
+            print(f'Invalid images, could not verify signature of {len(unsigned_images)} of the {len(self.expected_rhoai_images)} images:')
+            for image in unsigned_images:
+                print(f'  {image}')
+            sys.exit(1)
 
-        component_snapshot = yaml.safe_load(component_snapshot)
+        component_snapshot = self.render_template(self.template_dir, 'component_snapshot.yaml')
         component_snapshot['spec']['components'] = snapshot_components
 
         yaml.safe_dump(component_snapshot, open(f'{self.snapshot_components_dir}/snapshot-components-stage-{self.rhoai_application}-{self.epoch}.yaml', 'w'))
 
 
     def generate_component_release(self):
-        component_release = open(f'{self.template_dir}/release-components-stage.yaml').read()
-        for key, value in self.replacements.items():
-            component_release = component_release.replace(f'{{{{{key}}}}}', value)
-
-        component_release = yaml.safe_load(component_release)
+        component_release = self.render_template(self.template_dir, 'release-components-stage.yaml')
         yaml.safe_dump(component_release, open(f'{self.release_components_dir}/release-components-stage-{self.rhoai_application}-{self.epoch}.yaml', 'w'))
 
-
-
+    def generate_prod_component_release(self):
+        # the prod release points to the stage snapshot generated with it
+        component_release = self.render_template(self.prod_template_dir, 'release-components-prod.yaml')
+        component_release['spec']['snapshot'] = f'{self.rhoai_application}-{self.epoch}'
+        yaml.safe_dump(component_release, open(f'{self.release_components_dir}/prod-release-components-{self.rhoai_application}-{self.epoch}.yaml', 'w'))
+
+    def generate_fbc_artifacts(self, fbc_fragment:dict):
+        # fbc_fragment - ocp_version, fbc_fragment_image, git_url, git_commit and optionally fbc_application
+        fbc_application_suffix = fbc_fragment['ocp_version'].replace('v4.', '4')
+        fbc_application = fbc_fragment.get('fbc_application', f'{self.FBC_APPLICATION_PREFIX}{fbc_application_suffix}')
+        replacements = {**self.replacements, 'fbc_application': fbc_application, 'ocp-version': f'ocp-{fbc_application_suffix}',
+                        'fbc_fragment_image': fbc_fragment['fbc_fragment_image'], 'git_url': fbc_fragment['git_url'], 'git_commit': fbc_fragment['git_commit']}
+        file_suffix = f'ocp-{fbc_application_suffix}-{self.rhoai_application}-{self.epoch}'
+
+        fbc_snapshot = self.render_template(self.template_dir, 'fbc_snapshot.yaml', replacements)
+        yaml.safe_dump(fbc_snapshot, open(f'{self.snapshot_fbc_dir}/snapshot-fbc-stage-{file_suffix}.yaml', 'w'))
+        fbc_release = self.render_template(self.template_dir, 'release-fbc-stage.yaml', replacements)
+        yaml.safe_dump(fbc_release, open(f'{self.release_fbc_dir}/release-fbc-stage-{file_suffix}.yaml', 'w'))
+        fbc_release = self.render_template(self.prod_template_dir, 'release-fbc-prod.yaml', replacements)
+        fbc_release['spec']['snapshot'] = f'{fbc_application}-{self.epoch}'
+        yaml.safe_dump(fbc_release, open(f'{self.release_fbc_dir}/prod-release-fbc-{file_suffix}.yaml', 'w'))
+
+    def render_template(self, template_dir:str, template_name:str, replacements:dict=None):
+        return yaml.safe_load(get_template(f'{template_dir}/{template_name}').render(replacements or self.replacements))
+
+
+
+
+TEMPLATE_PLACEHOLDER_PATTERN = re.compile(r'{{([\w-]+)}}')
+
+class compiled_template:
+    # a template split once into its literal parts and placeholders, each render is then a single join
+    # placeholders without a replacement are kept as they are
+    def __init__(self, template_path:str):
+        parts = TEMPLATE_PLACEHOLDER_PATTERN.split(open(template_path).read())
+        self.literals = parts[0::2]
+        self.keys = parts[1::2]
+
+    def render(self, replacements:dict):
+        rendered = [self.literals[0]]
+        for key, literal in zip(self.keys, self.literals[1:]):
+            rendered.append(str(replacements[key]) if key in replacements else f'{{{{{key}}}}}')
+            rendered.append(literal)
+        return ''.join(rendered)
+
+@functools.lru_cache(maxsize=None)
+def get_template(template_path:str):
+    return compiled_template(template_path)
+
+def generate_release_artifacts_batch(targets_file_path:str, output_dir:str, epoch, template_dir:str, **processor_args):
+    # renders the stage and prod artifacts of every (version, application, catalog) target of the targets file
+    # the templates are compiled once and the quay metadata of an image is looked up once for all the targets
+    targets_config = yaml.safe_load(open(targets_file_path))
+    image_sources = {}
+    for sub_dir in ['release-components', 'snapshot-components', 'release-fbc', 'snapshot-fbc']:
+        os.makedirs(f'{output_dir}/{sub_dir}', exist_ok=True)
+
+    for target in targets_config['targets']:
+        print(f'generating the release artifacts of {target["rhoai_application"]} ({target["rhoai_version"]})')
+        processor = release_processor(catalog_yaml_path=target['catalog_yaml_path'], konflux_components_details_file_path=target['konflux_components_details_file_path'],
+                                      rhoai_version=target['rhoai_version'], output_dir=output_dir, rhoai_application=target['rhoai_application'], epoch=epoch,
+                                      template_dir=f'{template_dir}/stage', prod_template_dir=f'{template_dir}/prod',
+                                      rbc_release_commit=target.get('rbc_release_commit', targets_config.get('rbc_release_commit')),
+                                      image_sources=image_sources, **processor_args)
+        processor.generate_release_artifacts()
+        processor.generate_prod_component_release()
+        for fbc_fragment in target.get('fbc', []):
+            processor.generate_fbc_artifacts(fbc_fragment)
+        if processor.metadata_store:
+            processor.metadata_store.close()
+    print(f'{len(targets_config["targets"])} targets, {len(image_sources)} distinct images looked up')
+
+def index_images_by_repo(images):
+    images_by_repo = defaultdict(set)
+    for image in images:
+        repo, _, digest = image.partition('@')
+        images_by_repo[repo].add(digest)
+    return images_by_repo
+
+def extract_expected_rhoai_images(catalog_yaml_path:str, rhoai_version:str, catalog_parser:str='fast', catalog_cache_dir:str=''):
+    # runs in a worker process of validate_snapshot_with_catalog
+    processor = release_processor(catalog_yaml_path=catalog_yaml_path, konflux_components_details_file_path=None, rhoai_version=rhoai_version, output_dir=None, rhoai_application=None, epoch='', template_dir=None, rbc_release_commit=None, catalog_parser=catalog_parser, catalog_cache_dir=catalog_cache_dir)
+    processor.extract_rhoai_images_from_catalog()
+    return processor.expected_rhoai_images
+
+def get_catalog_yaml_paths(build_config_path:str, rbc_dir:str):
+    # ocp version -> catalog.yaml of every ocp version supported by the release
+    build_config = yaml.safe_load(open(build_config_path))
+    ocp_versions = build_config['config']['supported-ocp-versions']['release']
+    return {ocp_version: os.path.join(rbc_dir, 'catalog', ocp_version, 'rhods-operator', 'catalog.yaml') for ocp_version in ocp_versions}
 
 class snapshot_processor:
+    NEAR_MISSES_TO_REPORT = 3
     def __init__(self, snapshot_file_path:str, expected_rhoai_images_file_path:str, snapshot_name:str):
         self.snapshot_file_path = snapshot_file_path
         self.expected_rhoai_images_file_path = expected_rhoai_images_file_path
-        self.snaphot_images = json.load(open(self.snapshot_file_path))
+        self.snaphot_images = json.load(open(self.snapshot_file_path)) if self.snapshot_file_path else []
         self.expected_rhoai_images = json.load(open(self.expected_rhoai_images_file_path))
         self.snapshot_name = snapshot_name
+
+    def find_compatible_snapshot(self, snapshots_stream, output_file_path:str=''):
+        # snapshots_stream yields one json per line - {"snapshot_name": ..., "images": [...]}, newest first
+        # the search stops at the first compatible snapshot, otherwise the closest ones are reported
+        expected_rhoai_images = set(self.expected_rhoai_images)
+        near_misses = []
+        for line in snapshots_stream:
+            if not line.strip():
+                continue
+            snapshot = json.loads(line)
+            snapshot_images = {image for image in snapshot['images'] if image and 'rhoai-fbc-fragment' not in image}
+            missing_images = expected_rhoai_images - snapshot_images
+            extra_images = snapshot_images - expected_rhoai_images
+            if not missing_images and not extra_images:
+                print(f'{snapshot["snapshot_name"]} is compatible with the catalog!')
+                if output_file_path:
+                    json.dump({'snapshot_name': snapshot['snapshot_name'], 'compatible': 'YES', 'images': sorted(snapshot_images)}, open(output_file_path, 'w'), indent=4)
+                return snapshot['snapshot_name']
+            print(f'{snapshot["snapshot_name"]} is not compatible - {len(missing_images)} missing, {len(extra_images)} extra images')
+            near_misses.append((len(missing_images) + len(extra_images), snapshot['snapshot_name'], sorted(missing_images), sorted(extra_images)))
+
+        print(f'no compatible snapshot found among {len(near_misses)} snapshots')
+        for _, snapshot_name, missing_images, extra_images in sorted(near_misses)[:self.NEAR_MISSES_TO_REPORT]:
+            print(f'closest snapshot {snapshot_name}:')
+            for image in missing_images:
+                print(f'  missing - {image}')
+            for image in extra_images:
+                print(f'  extra   - {image}')
+        return None
     def check_snapshot_compatibility(self):
         self.snaphot_images = self.snaphot_images['images'] if 'images' in self.snaphot_images else self.snaphot_images
         self.snaphot_images = [image for image in self.snaphot_images if 'rhoai-fbc-fragment' not in image]
@@ -166,31 +399,119 @@ class snapshot_processor:
             result['compatible'] = 'YES'
         json.dump(result, open(self.snapshot_file_path, 'w'), indent=4)
 
-BASE_URL = 'https://quay.io/api/v1'
+class quay_metadata_cache:
+    # manifests and labels addressed by a sha256 digest are immutable, so they are cached
+    # in an in-process LRU and, optionally, on disk to be reused across runs
+    DEFAULT_MAX_ENTRIES = 1024
+    def __init__(self, cache_dir:str='', max_entries:int=DEFAULT_MAX_ENTRIES):
+        self.cache_dir = cache_dir
+        self.max_entries = max_entries
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get_entry_path(self, key):
+        return os.path.join(self.cache_dir, f'{hashlib.sha256("/".join(key).encode()).hexdigest()}.json')
+
+    def get(self, key):
+        with self.lock:
+            if key in self.entries:
+                self.entries.move_to_end(key)
+                return self.entries[key]
+        if self.cache_dir and os.path.exists(self.get_entry_path(key)):
+            try:
+                value = json.load(open(self.get_entry_path(key)))
+            except ValueError:
+                return None
+            self.put(key, value, persist=False)
+            return value
+        return None
+
+    def put(self, key, value, persist=True):
+        with self.lock:
+            self.entries[key] = value
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.max_entries:
+                self.entries.popitem(last=False)
+        if self.cache_dir and persist:
+            # written through a temp file, concurrent runs never read a partial entry
+            os.makedirs(self.cache_dir, exist_ok=True)
+            temp_path = f'{self.get_entry_path(key)}.{os.getpid()}.{threading.get_ident()}.tmp'
+            json.dump(value, open(temp_path, 'w'))
+            os.replace(temp_path, self.get_entry_path(key))
+
+metadata_cache = quay_metadata_cache()
+
+class signature_index:
+    # digests with a cosign signature tag (sha256-<hex>.sig) per repo, built from one paginated listing of
+    # the signature tags of the repo on its first lookup, every other lookup of the run is a set membership test
+    def __init__(self):
+        self.signed_digests = {}
+        self.lock = threading.Lock()
+        self.repo_locks = defaultdict(threading.Lock)
+
+    def is_signed(self, org, repo, digest):
+        with self.lock:
+            repo_lock = self.repo_locks[(org, repo)]
+        # the images of a repo looked up in parallel wait for a single listing
+        with repo_lock:
+            if (org, repo) not in self.signed_digests:
+                sig_tags = quay_controller(org).get_signature_tags(repo)
+                self.signed_digests[(org, repo)] = {sig_tag.removesuffix('.sig').replace('-', ':', 1) for sig_tag in sig_tags}
+        return digest in self.signed_digests[(org, repo)]
+
+signatures = signature_index()
+
+quay_client_lock = threading.Lock()
+shared_quay_client = None
+
+def get_quay_client():
+    # one client, i.e. one connection pool and one rate limit, for all the worker threads
+    # imported here, the operations not calling quay (catalog extraction, snapshot checks) don't need aiohttp
+    global shared_quay_client
+    with quay_client_lock:
+        if shared_quay_client is None:
+            from quay_client import blocking_quay_client
+            shared_quay_client = blocking_quay_client()
+    return shared_quay_client
+
 class quay_controller:
     def __init__(self, org:str):
         self.org = org
+        self.token = os.environ[self.org.upper() + "_QUAY_API_TOKEN"]
+
+    def get_json(self, path, params, endpoint, expected_key):
+        quay = get_quay_client()
+        try:
+            response_json = quay.get_json(path, params=params, endpoint=endpoint, token=self.token)
+        except quay.error as e:
+            print(e)
+            sys.exit(1)
+        if expected_key in response_json:
+            return response_json
+        else:
+            print(response_json)
+            sys.exit(1)
+
     def get_tag_details(self, repo, tag):
         result_tag = {}
-        url = f'{BASE_URL}/repository/{self.org}/{repo}/tag/?specificTag={tag}&onlyActiveTags=true'
-        headers = {'Authorization': f'Bearer {os.environ[self.org.upper() + "_QUAY_API_TOKEN"]}',
-                   'Accept': 'application/json'}
-        response = requests.get(url, headers=headers)
-        tags = response.json()['tags']
+        tags = self.get_json(f'repository/{self.org}/{repo}/tag/', {'specificTag': tag, 'onlyActiveTags': 'true'}, 'tag', 'tags')['tags']
         if tags:
             result_tag = tags[0]
         return result_tag
-    def get_all_tags(self, repo, tag):
-        url = f'{BASE_URL}/repository/{self.org}/{repo}/tag/?specificTag={tag}&onlyActiveTags=false'
-        headers = {'Authorization': f'Bearer {os.environ[self.org.upper() + "_QUAY_API_TOKEN"]}',
-                   'Accept': 'application/json'}
-        response = requests.get(url, headers=headers)
-        if 'tags' in response.json():
-            tag = response.json()['tags']
-            return tag
-        else:
-            print(response.json())
+
+    def get_signature_tags(self, repo):
+        # names of all the active signature tags of the repo, 100 per page
+        quay = get_quay_client()
+        try:
+            tags = quay.get_all_items(f'repository/{self.org}/{repo}/tag/', 'tags', endpoint='tag',
+                                      params={'onlyActiveTags': 'true', 'limit': 100, 'filter_tag_name': 'like:.sig'}, token=self.token)
+        except (quay.error, KeyError) as e:
+            print(e)
             sys.exit(1)
+        return [tag['name'] for tag in tags if tag['name'].endswith('.sig')]
+
+    def get_all_tags(self, repo, tag):
+        return self.get_json(f'repository/{self.org}/{repo}/tag/', {'specificTag': tag, 'onlyActiveTags': 'false'}, 'tag', 'tags')['tags']
 
     def get_supported_archs(self, repo, manifest_digest):
         manifest_json = self.get_manifest_details(repo, manifest_digest)
@@ -212,37 +533,37 @@ class quay_controller:
                 image_manifest_digests.append(manifest['digest'])
         return image_manifest_digests
 
-    def get_manifest_details(self, repo, manifest_digest):
-        url = f'{BASE_URL}/repository/{self.org}/{repo}/manifest/{manifest_digest}'
-        headers = {'Authorization': f'Bearer {os.environ[self.org.upper() + "_QUAY_API_TOKEN"]}',
-                   'Accept': 'application/json'}
-        response = requests.get(url, headers=headers)
+    def get_cacheable_json(self, repo, digest, endpoint, path, expected_key, params=None):
+        # only responses of digest-addressed (immutable) endpoints are cached, tags can move
+        cache_key = (self.org, repo, digest, endpoint) if digest.startswith('sha256:') else None
+        if cache_key:
+            cached = metadata_cache.get(cache_key)
+            if cached is not None:
+                return cached
+        response_json = self.get_json(path, params, endpoint, expected_key)
+        if cache_key:
+            metadata_cache.put(cache_key, response_json)
+        return response_json
 
-        if 'manifest_data' in response.json():
-            return response.json()
-        else:
-            print(response.json())
-            sys.exit(1)
+    def get_manifest_details(self, repo, manifest_digest):
+        path = f'repository/{self.org}/{repo}/manifest/{manifest_digest}'
+        return self.get_cacheable_json(repo, manifest_digest, 'manifest', path, 'manifest_data')
 
     def get_git_labels(self, repo, tag):
-        url = f'{BASE_URL}/repository/{self.org}/{repo}/manifest/{tag}/labels?filter=git'
-        headers = {'Authorization': f'Bearer {os.environ[self.org.upper() + "_QUAY_API_TOKEN"]}',
-                   'Accept': 'application/json'}
-        response = requests.get(url, headers=headers)
-        if 'labels' in response.json():
-            labels = response.json()['labels']
-            return labels
-        else:
-            print(response.json())
-            sys.exit(1)
+        path = f'repository/{self.org}/{repo}/manifest/{tag}/labels'
+        return self.get_cacheable_json(repo, tag, 'labels-git', path, 'labels', {'filter': 'git'})['labels']
 
 if __name__ == '__main__':
     parser = argparse.ArgumentParser()
     parser.add_argument('-op', '--operation', required=False,
-                        help='Operation code, supported values are "generate-release-artifacts", "validate-snapshot-with-catalog", "extract-rhoai-images-from-catalog" and "check-snapshot-compatibility"',
+                        help='Operation code, supported values are "generate-release-artifacts", "generate-release-artifacts-batch", "validate-snapshot-with-catalog", "extract-rhoai-images-from-catalog", "check-snapshot-compatibility" and "find-compatible-snapshot"',
                         dest='operation')
     parser.add_argument('-c', '--catalog-yaml-path', required=False,
                         help='Path of the catalog.yaml from the current catalog.', dest='catalog_yaml_path')
+    parser.add_argument('-b', '--build-config-path', required=False,
+                        help='Path of the config/build-config.yaml, to validate the catalogs of all its supported-ocp-versions', dest='build_config_path')
+    parser.add_argument('-rd', '--rbc-dir', required=False,
+                        help='Path of the RBC checkout with the catalog/<ocp-version>/rhods-operator/catalog.yaml of the supported ocp versions', dest='rbc_dir')
     parser.add_argument('-k', '--konflux-components-details-file-path', required=False,
                         help='Path of the yaml with details of all the konflux components for current version.', dest='konflux_components_details_file_path')
     parser.add_argument('-v', '--rhoai-version', required=False,
@@ -253,6 +574,8 @@ if __name__ == '__main__':
                         help='centrally generated epoch to be used with all the artifacts', dest='epoch')
     parser.add_argument('-t', '--template-dir', required=False,
                         help='Dir with all the template artifacts', dest='template_dir')
+    parser.add_argument('-tf', '--targets-file-path', required=False,
+                        help='yaml with the targets of generate-release-artifacts-batch, see README.md', dest='targets_file_path')
     parser.add_argument('-r', '--rbc-release-commit', required=False,
                         help='Dir with all the template artifacts', dest='rbc_release_commit')
 
@@ -265,28 +588,59 @@ if __name__ == '__main__':
                         help='Path of the snapshot yaml', dest='snapshot_file_path')
     parser.add_argument('-n', '--snapshot-name', required=False,
                         help='Path of the snapshot yaml', dest='snapshot_name')
+    parser.add_argument('-sl', '--snapshots-file-path', required=False,
+                        help='json-lines file of the snapshots to search, {"snapshot_name": ..., "images": [...]} per line, stdin if "-" or not set', dest='snapshots_file_path')
     parser.add_argument('-e', '--expected-rhoai-images-file-path', required=False,
                         help='expected rhoai images in the catalog yaml', dest='expected_rhoai_images_file_path')
+    parser.add_argument('-w', '--max-workers', required=False, type=int, default=release_processor.DEFAULT_MAX_WORKERS,
+                        help='Max number of images whose quay metadata is fetched in parallel', dest='max_workers')
+    parser.add_argument('-qc', '--quay-cache-dir', required=False, default='',
+                        help='Dir to persist the digest-addressed quay manifests and labels across runs', dest='quay_cache_dir')
+    parser.add_argument('-ms', '--metadata-store', required=False, default='',
+                        help='Path of the sqlite store of the git labels of signed images, shared across runs (see metadata_store.py)', dest='metadata_store')
+    parser.add_argument('-cp', '--catalog-parser', required=False, default='fast', choices=['fast', 'roundtrip'],
+                        help='fast - only parse the catalog entries of the current operator, roundtrip - parse the whole catalog with ruamel', dest='catalog_parser')
+    parser.add_argument('-qs', '--quay-stats', required=False, action='store_true',
+                        help='Print the number of quay api requests, retries and latencies per endpoint at the end', dest='quay_stats')
+    parser.add_argument('-cc', '--catalog-cache-dir', required=False, default=release_processor.DEFAULT_CATALOG_CACHE_DIR,
+                        help='Dir to cache the extracted catalog entries by catalog hash, empty to disable', dest='catalog_cache_dir')
 
     args = parser.parse_args()
+    metadata_cache.cache_dir = args.quay_cache_dir
 
     if args.operation.lower() == 'generate-release-artifacts':
-        processor = release_processor(catalog_yaml_path=args.catalog_yaml_path, konflux_components_details_file_path=args.konflux_components_details_file_path, rhoai_version=args.rhoai_version, output_dir=args.output_dir, rhoai_application=args.rhoai_application, epoch=args.epoch, template_dir=args.template_dir, rbc_release_commit=args.rbc_release_commit)
+        processor = release_processor(catalog_yaml_path=args.catalog_yaml_path, konflux_components_details_file_path=args.konflux_components_details_file_path, rhoai_version=args.rhoai_version, output_dir=args.output_dir, rhoai_application=args.rhoai_application, epoch=args.epoch, template_dir=args.template_dir, rbc_release_commit=args.rbc_release_commit, max_workers=args.max_workers, metadata_store_path=args.metadata_store, catalog_parser=args.catalog_parser, catalog_cache_dir=args.catalog_cache_dir)
         processor.generate_release_artifacts()
 
+    elif args.operation.lower() == 'generate-release-artifacts-batch':
+        generate_release_artifacts_batch(targets_file_path=args.targets_file_path, output_dir=args.output_dir, epoch=args.epoch, template_dir=args.template_dir or 'templates',
+                                         max_workers=args.max_workers, metadata_store_path=args.metadata_store, catalog_parser=args.catalog_parser, catalog_cache_dir=args.catalog_cache_dir)
+
     elif args.operation.lower() == 'generate-snapshots':
-        processor = release_processor(catalog_yaml_path=args.catalog_yaml_path, konflux_components_details_file_path=args.konflux_components_details_file_path, rhoai_version=args.rhoai_version, output_dir=args.output_dir, rhoai_application=args.rhoai_application, epoch=args.epoch, template_dir=args.template_dir, rbc_release_commit=args.rbc_release_commit)
+        processor = release_processor(catalog_yaml_path=args.catalog_yaml_path, konflux_components_details_file_path=args.konflux_components_details_file_path, rhoai_version=args.rhoai_version, output_dir=args.output_dir, rhoai_application=args.rhoai_application, epoch=args.epoch, template_dir=args.template_dir, rbc_release_commit=args.rbc_release_commit, max_workers=args.max_workers, metadata_store_path=args.metadata_store, catalog_parser=args.catalog_parser, catalog_cache_dir=args.catalog_cache_dir)
         processor.extract_rhoai_images_from_catalog()
         processor.generate_component_snapshot()
 
     elif args.operation.lower() == 'validate-snapshot-with-catalog':
-        processor = release_processor(catalog_yaml_path=args.catalog_yaml_path, konflux_components_details_file_path=args.konflux_components_details_file_path, snapshot_file_path=args.snapshot_file_path, rhoai_version=args.rhoai_version, output_dir=None, rhoai_application=args.rhoai_application, epoch='', template_dir=None, rbc_release_commit=None)
-        processor.validate_snapshot_with_catalog()
+        processor = release_processor(catalog_yaml_path=args.catalog_yaml_path, konflux_components_details_file_path=args.konflux_components_details_file_path, snapshot_file_path=args.snapshot_file_path, rhoai_version=args.rhoai_version, output_dir=None, rhoai_application=args.rhoai_application, epoch='', template_dir=None, rbc_release_commit=None, catalog_parser=args.catalog_parser, catalog_cache_dir=args.catalog_cache_dir)
+        catalog_yaml_paths = get_catalog_yaml_paths(args.build_config_path, args.rbc_dir) if args.build_config_path else None
+        processor.validate_snapshot_with_catalog(catalog_yaml_paths)
 
 
     elif args.operation.lower() == 'extract-rhoai-images-from-catalog':
-        processor = release_processor(catalog_yaml_path=args.catalog_yaml_path, rhoai_version=args.rhoai_version, output_file_path=args.output_file_path)
+        processor = release_processor(catalog_yaml_path=args.catalog_yaml_path, konflux_components_details_file_path=None, rhoai_version=args.rhoai_version, output_dir=None, rhoai_application=None, epoch='', template_dir=None, rbc_release_commit=None, catalog_parser=args.catalog_parser, catalog_cache_dir=args.catalog_cache_dir)
         processor.extract_rhoai_images_from_catalog()
+        json.dump(processor.expected_rhoai_images, open(args.output_file_path, 'w'), indent=4)
     elif args.operation.lower() == 'check-snapshot-compatibility':
         processor = snapshot_processor(snapshot_file_path=args.snapshot_file_path, expected_rhoai_images_file_path=args.expected_rhoai_images_file_path, snapshot_name=args.snapshot_name)
         processor.check_snapshot_compatibility()
+    elif args.operation.lower() == 'find-compatible-snapshot':
+        processor = snapshot_processor(snapshot_file_path=None, expected_rhoai_images_file_path=args.expected_rhoai_images_file_path, snapshot_name=None)
+        snapshots_stream = sys.stdin if args.snapshots_file_path in (None, '-') else open(args.snapshots_file_path)
+        if not processor.find_compatible_snapshot(snapshots_stream, args.output_file_path):
+            sys.exit(1)
+
+    if shared_quay_client:
+        if args.quay_stats:
+            shared_quay_client.print_stats()
+        shared_quay_client.close()
@@ -123,7 +123,9 @@ kubectl get components -o=jsonpath="{range .items[?(@.spec.application=='${compo
 
 
 release_processor_path="../rhoai-release-helper/release_processor.py"
-RHOAI_QUAY_API_TOKEN=${RHOAI_QUAY_API_TOKEN} python "$release_processor_path" --operation generate-snapshots --catalog-yaml-path ${CATALOG_YAML_PATH} --konflux-components-details-file-path ${RHOAI_KONFLUX_COMPONENTS_DETAILS_FILE_PATH} --rhoai-version ${rhoai_version} --rhoai-application ${component_application} --epoch ${epoch} --output-dir ${output_dir} --template-dir ${template_dir} --rbc-release-commit ${RBC_RELEASE_BRANCH_COMMIT}
+# metadata of signed images, reused across runs as most of them carry over unchanged between nightlies
+METADATA_STORE_PATH=${METADATA_STORE_PATH:-${HOME}/.cache/rhoai-release-helper/image-metadata.db}
+RHOAI_QUAY_API_TOKEN=${RHOAI_QUAY_API_TOKEN} python "$release_processor_path" --operation generate-snapshots --catalog-yaml-path ${CATALOG_YAML_PATH} --konflux-components-details-file-path ${RHOAI_KONFLUX_COMPONENTS_DETAILS_FILE_PATH} --rhoai-version ${rhoai_version} --rhoai-application ${component_application} --epoch ${epoch} --output-dir ${output_dir} --template-dir ${template_dir} --rbc-release-commit ${RBC_RELEASE_BRANCH_COMMIT} --metadata-store ${METADATA_STORE_PATH}
 
 # generate FBC snapshot
 ocp_version="v4.17"
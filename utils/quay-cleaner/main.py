@@ -1,38 +1,96 @@
-
-from quay_controller import quay_controller
+import argparse
+import asyncio
+import os
+import sys
+from collections import defaultdict
 import json, traceback
-def main():
-    orgs = ['opendatahub', 'modh']
-    repos_to_be_deleted = []
-    repos_plain_list = ""
+# the quay api client shared with tools/rhoai-release-helper
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'quay-client'))
+from quay_client import quay_client, DEFAULT_RATE, DEFAULT_BURST
+from quay_controller import quay_controller, FRESHNESS_WINDOW
+
+# the cleanup runs as a pipeline: repo discovery -> tag scanning -> deletion
+# each stage has its own pool of workers, bounded queues between the stages hold the producers back
+# when the consumers fall behind, and a semaphore per org bounds the requests in flight for each org
+SCAN_WORKERS = 8
+DELETE_WORKERS = 16
+ORG_CONCURRENCY = 12
+QUEUE_SIZE = 200
 
+async def discover_repos(qc, repo_queue, discovered_repos):
+    for repo in await qc.get_all_repos():
+        discovered_repos.append(f'{qc.org}/{repo}')
+        await repo_queue.put((qc, repo))
 
-    for org in orgs:
-        qc = quay_controller(org)
-        repos = qc.get_all_repos()
+async def scan_tags(repo_queue, tag_queue, org_limits):
+    while True:
+        qc, repo = await repo_queue.get()
         try:
-            for repo in repos:
-                repo_obj = {}
-                repo_obj['repo'] = f'{org}/{repo}'
-                tags = qc.get_all_tags_between_given_dates(repo)
-                repo_obj['tags'] = []
-                for tag in tags:
-                    qc.delete_tag(repo, tag)
-                    repo_obj['tags'].append(tag)
-                    repos_plain_list += f'quay.io/{org}/{repo}@{tag["digest"]}\n'
-                if repo_obj['tags']:
-                    repos_to_be_deleted.append(repo_obj)
+            async with org_limits[qc.org]:
+                tags = await qc.get_all_tags_between_given_dates(repo)
+            for tag in tags:
+                await tag_queue.put((qc, repo, tag))
         except Exception as e:
             print(e)
             print(traceback.format_exc())
-            print(f'Exception while processing {repo} for tag {tag}')
+            print(f'Exception while scanning {qc.org}/{repo}')
+        finally:
+            repo_queue.task_done()
+
+async def delete_tags(tag_queue, org_limits, deleted_tags):
+    while True:
+        qc, repo, tag = await tag_queue.get()
+        try:
+            async with org_limits[qc.org]:
+                deleted = await qc.delete_tag(repo, tag)
+            if deleted:
+                deleted_tags[f'{qc.org}/{repo}'].append(tag)
+        except Exception:
+            print(f'Exception while processing {qc.org}/{repo} for tag {tag}')
+        finally:
+            tag_queue.task_done()
+
+async def main(args):
+    discovered_repos = []
+    deleted_tags = defaultdict(list)
+    org_limits = defaultdict(lambda: asyncio.Semaphore(args.org_concurrency))
+    repo_queue = asyncio.Queue(maxsize=args.queue_size)
+    tag_queue = asyncio.Queue(maxsize=args.queue_size)
 
+    async with quay_client(rate=args.rate, burst=args.burst, max_connections=args.scan_workers + args.delete_workers) as client:
+        scanners = [asyncio.create_task(scan_tags(repo_queue, tag_queue, org_limits)) for _ in range(args.scan_workers)]
+        deleters = [asyncio.create_task(delete_tags(tag_queue, org_limits, deleted_tags)) for _ in range(args.delete_workers)]
+        discoveries = [discover_repos(quay_controller(org, client, args.freshness_window), repo_queue, discovered_repos) for org in args.orgs]
+        for org, result in zip(args.orgs, await asyncio.gather(*discoveries, return_exceptions=True)):
+            if isinstance(result, Exception):
+                print(result)
+                print(f'Exception while discovering the repos of {org}')
+        # every repo is scanned before the last tags are queued for deletion
+        await repo_queue.join()
+        await tag_queue.join()
+        for worker in scanners + deleters:
+            worker.cancel()
+        await asyncio.gather(*scanners, *deleters, return_exceptions=True)
+        client.print_stats()
 
+    # the report keeps the discovery order of the repos
+    repos_to_be_deleted = [{'repo': repo, 'tags': deleted_tags[repo]} for repo in discovered_repos if deleted_tags[repo]]
+    repos_plain_list = ''.join(f'quay.io/{repo_obj["repo"]}@{tag["digest"]}\n' for repo_obj in repos_to_be_deleted for tag in repo_obj['tags'])
     open('images_to_be_deleted.json', 'w').write(json.dumps(repos_to_be_deleted, indent=4))
     open('images_plain_list.txt', 'a').write(repos_plain_list)
 
 
 
 if __name__ == '__main__':
-    main()
-
+    parser = argparse.ArgumentParser(description='Deletes the quay tags last modified between START_DATE and END_DATE of quay_controller.py')
+    parser.add_argument('--orgs', nargs='+', default=['opendatahub', 'modh'], help='Orgs to clean up', dest='orgs')
+    parser.add_argument('--scan-workers', type=int, default=SCAN_WORKERS, help='Number of repos scanned concurrently', dest='scan_workers')
+    parser.add_argument('--delete-workers', type=int, default=DELETE_WORKERS, help='Number of tags deleted concurrently', dest='delete_workers')
+    parser.add_argument('--org-concurrency', type=int, default=ORG_CONCURRENCY, help='Max concurrent scans and deletions per org', dest='org_concurrency')
+    parser.add_argument('--queue-size', type=int, default=QUEUE_SIZE, help='Max repos and tags waiting between the stages', dest='queue_size')
+    parser.add_argument('--freshness-window', type=float, default=FRESHNESS_WINDOW,
+                        help='Seconds the scan listing of a repo is trusted before deleting its tags, the repo is listed again past it', dest='freshness_window')
+    parser.add_argument('--rate', type=float, default=DEFAULT_RATE, help='Max quay api requests per second', dest='rate')
+    parser.add_argument('--burst', type=int, default=DEFAULT_BURST, help='Max burst of quay api requests', dest='burst')
+    args = parser.parse_args()
+    asyncio.run(main(args))
@@ -1,48 +1,110 @@
+import asyncio
+import functools
 import os
+import sys
+import time
+from collections import defaultdict
 
-import requests
 from datetime import datetime
 import traceback
 
-BASE_URL = 'https://quay.io/api/v1'
+# the quay api client shared with tools/rhoai-release-helper
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'quay-client'))
+from quay_client import quay_client
+
 START_DATE = datetime.strptime('04-05-24 00:00:00 -0000', '%m-%d-%y %H:%M:%S %z')
 END_DATE = datetime.strptime('04-09-24 23:59:59 -0500', '%m-%d-%y %H:%M:%S %z')
+# seconds a listing of a repo is trusted to revalidate its tags before deleting them, an older one is listed again
+FRESHNESS_WINDOW = 60
+# tags per page of the tag listings, and pages of the window of a repo fetched concurrently
+PAGE_SIZE = 100
+PAGE_CONCURRENCY = 8
+
+@functools.lru_cache(maxsize=65536)
+def parse_last_modified(last_modified):
+    # the same timestamps are parsed again by the probes and the revalidation of the deletions
+    return datetime.strptime(last_modified, '%a, %d %b %Y %H:%M:%S %z')
 
 class quay_controller:
-    def __init__(self, org):
+    def __init__(self, org, client:quay_client, freshness_window:float=FRESHNESS_WINDOW):
         self.org = org
+        self.client = client
+        self.freshness_window = freshness_window
+        # repo -> (listed at, tag name -> tag) of the latest listing of the repo
+        self.listed_tags = {}
+        self.listing_locks = defaultdict(asyncio.Lock)
+
+
+    async def get_all_repos(self):
+        params = {'last_modified': 'true', 'namespace': self.org, 'popularity': 'true', 'public': 'true', 'quota': 'true'}
+        repositories = await self.client.get_all_items('repository', 'repositories', params=params, endpoint='repository', next_page=True)
+        return [repo['name'] for repo in repositories]
+
 
+    async def get_tag_page(self, repo, page, pages):
+        # pages - page -> response of the pages of the repo already fetched by this listing
+        if page not in pages:
+            pages[page] = await self.client.get_json(f'repository/{self.org}/{repo}/tag/', params={'limit': PAGE_SIZE, 'onlyActiveTags': 'true', 'page': page}, endpoint='tag')
+        return pages[page]
 
-    def get_all_repos(self):
-        repositories = []
-        url = f'{BASE_URL}/repository?last_modified=true&namespace={self.org}&popularity=true&public=true&quota=true'
-        response = requests.get(url)
-        if response.json():
-            resp_object = response.json()
-            repositories += [repo['name'] for repo in resp_object['repositories']]
-            while 'next_page' in resp_object:
-                next_url = f"{url}&next_page={resp_object['next_page']}"
-                response = requests.get(next_url)
-                resp_object = response.json()
-                repositories += [repo['name'] for repo in resp_object['repositories']]
+    async def find_first_page(self, repo, pages, first_page, is_past):
+        # smallest page from first_page for which is_past(page) is true, is_past has to be monotonic over the pages
+        # the bound is found by doubling the distance from first_page, then the page by bisection
+        if is_past(await self.get_tag_page(repo, first_page, pages)):
+            return first_page
+        lo, step = first_page, 1
+        while not is_past(await self.get_tag_page(repo, lo + step, pages)):
+            lo, step = lo + step, step * 2
+        hi = lo + step
+        while hi - lo > 1:
+            mid = (lo + hi) // 2
+            if is_past(await self.get_tag_page(repo, mid, pages)):
+                hi = mid
+            else:
+                lo = mid
+        return hi
 
-        return repositories
+    async def list_tags_in_window(self, repo):
+        # active tags of the pages overlapping [START_DATE, END_DATE], newest first
+        # the tags are listed newest first, so the window is found by probing a few pages, then its pages are fetched
+        # concurrently, instead of paging through all the tags newer than END_DATE
+        pages = {}
+        def is_last(resp_object):
+            return not resp_object['tags'] or not resp_object.get('has_additional')
+        def reaches_end_date(resp_object):
+            return is_last(resp_object) or parse_last_modified(resp_object['tags'][-1]['last_modified']) <= END_DATE
+        def reaches_start_date(resp_object):
+            return is_last(resp_object) or parse_last_modified(resp_object['tags'][-1]['last_modified']) <= START_DATE
 
+        first_page = await self.find_first_page(repo, pages, 1, reaches_end_date)
+        last_page = await self.find_first_page(repo, pages, first_page, reaches_start_date)
+        semaphore = asyncio.Semaphore(PAGE_CONCURRENCY)
+        async def get_window_page(page):
+            async with semaphore:
+                return await self.get_tag_page(repo, page, pages)
+        window_pages = await asyncio.gather(*[get_window_page(page) for page in range(first_page, last_page + 1)])
 
-    def get_all_tags_between_given_dates(self, repo):
+        # a tag pushed or deleted while probing shifts the pages, a tag seen on two pages is kept once
+        listed_tags = list({tag['name']: tag for resp_object in window_pages for tag in resp_object['tags']}.values())
+        self.listed_tags[repo] = (time.monotonic(), {tag['name']: tag for tag in listed_tags})
+        return listed_tags
+
+    async def get_current_tags(self, repo):
+        # the scan listing while it's fresh, else one re-listing shared by all the deletions of the repo
+        # waiting for it, a listing made after a deletion was requested is always fresh enough for it
+        requested_at = time.monotonic()
+        async with self.listing_locks[repo]:
+            listed_at, current_tags = self.listed_tags.get(repo, (0, None))
+            if current_tags is None or listed_at < requested_at - self.freshness_window:
+                await self.list_tags_in_window(repo)
+                listed_at, current_tags = self.listed_tags[repo]
+        return current_tags
+
+    async def get_all_tags_between_given_dates(self, repo):
         tags = []
-        url = f'{BASE_URL}/repository/{self.org}/{repo}/tag/?limit=100&onlyActiveTags=true'
         try:
-            for page in range(1, 100):
-                page_url = f"{url}&page={page}"
-                response = requests.get(page_url)
-                resp_object = response.json()
-                tags += [{'name':tag['name'], 'digest': tag['manifest_digest'], 'created_on': tag['last_modified']} for tag in resp_object['tags'] if START_DATE <= datetime.strptime(tag['last_modified'], '%a, %d %b %Y %H:%M:%S %z') <= END_DATE]
-                if not resp_object['tags']:
-                    break
-                last_date = datetime.strptime(resp_object['tags'][-1]['last_modified'], '%a, %d %b %Y %H:%M:%S %z')
-                if last_date <= START_DATE:
-                    break
+            listed_tags = await self.list_tags_in_window(repo)
+            tags = [{'name':tag['name'], 'digest': tag['manifest_digest'], 'created_on': tag['last_modified']} for tag in listed_tags if START_DATE <= parse_last_modified(tag['last_modified']) <= END_DATE]
             print(f'{self.org}/{repo}', len(tags))
         except Exception as e:
             print(e)
@@ -51,26 +113,25 @@ class quay_controller:
 
         return tags
 
-    def get_tag_details(self, repo, tag):
-        url = f'{BASE_URL}/repository/{self.org}/{repo}/tag/?specificTag={tag["name"]}'
-        response = requests.get(url)
-        tag = response.json()['tags'][0]
-        return tag
-
-
-
-    def delete_tag(self, repo, tag):
-        url = f'{BASE_URL}/repository/{self.org}/{repo}/tag/{tag["name"]}'
+    async def delete_tag(self, repo, tag):
+        # True if the tag was deleted
         try:
-            tag_details = self.get_tag_details(repo, tag)
-            if START_DATE <= datetime.strptime(tag_details['last_modified'], '%a, %d %b %Y %H:%M:%S %z') <= END_DATE:
+            current_tags = await self.get_current_tags(repo)
+            tag_details = current_tags.get(tag['name'])
+            # a tag re-pushed since the scan points to another digest or has a newer last_modified, it's kept
+            if not tag_details or tag_details['manifest_digest'] != tag['digest'] or tag_details['last_modified'] != tag['created_on']:
+                print(f'Skipping quay.io/{self.org}/{repo}:{tag["name"]}, re-pushed or deleted since the scan')
+                return False
+            if START_DATE <= parse_last_modified(tag_details['last_modified']) <= END_DATE:
                 with open('Quay-Cleanup-Logs.txt', 'a') as log:
                     print(f'Deleting quay.io/{self.org}/{repo}@{tag["digest"]}')
                     log.write(f'Deleting quay.io/{self.org}/{repo}@{tag["digest"]}\n')
-                    response = requests.delete(url, headers={'Authorization': f'Bearer {os.environ[self.org + "_token"]}'})
-                    print(response.status_code)
+                    status, _ = await self.client.request('DELETE', f'repository/{self.org}/{repo}/tag/{tag["name"]}', endpoint='delete-tag', token=os.environ[self.org + "_token"])
+                    print(status)
                     print(f'Deleted quay.io/{self.org}/{repo}@{tag["digest"]}')
                     log.write(f'Deleted quay.io/{self.org}/{repo}@{tag["digest"]}\n')
+                    return status < 400
+            return False
         except Exception as e:
             print(e)
             print(traceback.format_exc())
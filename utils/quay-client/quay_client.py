@@ -0,0 +1,223 @@
+import asyncio
+import os
+import random
+import threading
+import time
+from collections import defaultdict
+
+import aiohttp
+
+# Async client of the Quay API shared by tools/rhoai-release-helper and utils/quay-cleaner
+# consumers add this dir to sys.path and 'from quay_client import quay_client'
+
+# QUAY_API_URL points the client to another quay instance, e.g. a local stand-in
+BASE_URL = os.getenv('QUAY_API_URL', 'https://quay.io/api/v1')
+
+# quay.io throttles the API per client IP, the bucket keeps the whole process under the limit
+DEFAULT_RATE = 10
+DEFAULT_BURST = 20
+DEFAULT_MAX_CONNECTIONS = 20
+DEFAULT_TIMEOUT = 60
+
+# 429 and 5xx responses, and connection errors, are retried with exponential backoff and jitter
+MAX_ATTEMPTS = 6
+BACKOFF_BASE = 1
+BACKOFF_MAX = 60
+RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+
+class quay_api_error(Exception):
+    def __init__(self, method, url, status, body):
+        super().__init__(f'{method} {url} returned {status} - {body}')
+        self.method = method
+        self.url = url
+        self.status = status
+        self.body = body
+
+
+class token_bucket:
+    # paces the requests of all the coroutines sharing the client
+    # a 429 pauses the whole bucket, not only the request that got it
+    def __init__(self, rate:float, burst:int):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated_at = time.monotonic()
+        self.paused_until = 0
+        self.lock = None
+
+    def pause(self, seconds:float):
+        self.paused_until = max(self.paused_until, time.monotonic() + seconds)
+
+    async def acquire(self):
+        # the lock is created lazily, it has to belong to the loop of the client
+        if self.lock is None:
+            self.lock = asyncio.Lock()
+        async with self.lock:
+            while True:
+                now = time.monotonic()
+                if now < self.paused_until:
+                    await asyncio.sleep(self.paused_until - now)
+                    continue
+                self.tokens = min(self.burst, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+
+class quay_client:
+    def __init__(self, token:str=None, base_url:str=BASE_URL, rate:float=DEFAULT_RATE, burst:int=DEFAULT_BURST,
+                 max_connections:int=DEFAULT_MAX_CONNECTIONS, timeout:float=DEFAULT_TIMEOUT, max_attempts:int=MAX_ATTEMPTS):
+        self.token = token
+        self.base_url = base_url.rstrip('/')
+        self.bucket = token_bucket(rate, burst)
+        self.max_connections = max_connections
+        self.timeout = timeout
+        self.max_attempts = max_attempts
+        self.session = None
+        # endpoint -> requests, retries, errors, seconds, max_seconds
+        self.stats = defaultdict(lambda: {'requests': 0, 'retries': 0, 'errors': 0, 'seconds': 0.0, 'max_seconds': 0.0})
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, *exc_info):
+        await self.close()
+
+    def get_session(self):
+        # one keep-alive pool for all the requests, created in the running loop on first use
+        if self.session is None or self.session.closed:
+            connector = aiohttp.TCPConnector(limit=self.max_connections, keepalive_timeout=30)
+            self.session = aiohttp.ClientSession(connector=connector, timeout=aiohttp.ClientTimeout(total=self.timeout),
+                                                 headers={'Accept': 'application/json'})
+        return self.session
+
+    async def close(self):
+        if self.session is not None and not self.session.closed:
+            await self.session.close()
+
+    def get_backoff(self, attempt:int, retry_after=None):
+        if retry_after:
+            try:
+                return float(retry_after)
+            except ValueError:
+                pass
+        return min(BACKOFF_MAX, BACKOFF_BASE * 2 ** (attempt - 1)) * random.uniform(0.5, 1)
+
+    async def request(self, method:str, path:str, params:dict=None, endpoint:str='other', token:str=None):
+        # returns (status, json body or text), the retryable failures are retried until max_attempts
+        url = path if path.startswith('http') else f'{self.base_url}/{path.lstrip("/")}'
+        token = token or self.token
+        headers = {'Authorization': f'Bearer {token}'} if token else {}
+        stats = self.stats[endpoint]
+        for attempt in range(1, self.max_attempts + 1):
+            await self.bucket.acquire()
+            started_at = time.monotonic()
+            try:
+                async with self.get_session().request(method, url, params=params, headers=headers) as response:
+                    if response.content_type == 'application/json':
+                        body = await response.json()
+                    else:
+                        body = await response.text()
+                    status = response.status
+                    retry_after = response.headers.get('Retry-After')
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                status, body, retry_after = None, str(e), None
+            elapsed = time.monotonic() - started_at
+            stats['requests'] += 1
+            stats['seconds'] += elapsed
+            stats['max_seconds'] = max(stats['max_seconds'], elapsed)
+
+            if status is not None and status not in RETRYABLE_STATUSES:
+                return status, body
+            if attempt == self.max_attempts:
+                stats['errors'] += 1
+                raise quay_api_error(method, url, status, body)
+            stats['retries'] += 1
+            backoff = self.get_backoff(attempt, retry_after)
+            if status == 429:
+                self.bucket.pause(backoff)
+            await asyncio.sleep(backoff)
+
+    async def get_json(self, path:str, params:dict=None, endpoint:str='other', token:str=None):
+        status, body = await self.request('GET', path, params=params, endpoint=endpoint, token=token)
+        if status >= 400:
+            self.stats[endpoint]['errors'] += 1
+            raise quay_api_error('GET', path, status, body)
+        return body
+
+    async def delete(self, path:str, endpoint:str='other', token:str=None):
+        status, body = await self.request('DELETE', path, endpoint=endpoint, token=token)
+        if status >= 400:
+            self.stats[endpoint]['errors'] += 1
+            raise quay_api_error('DELETE', path, status, body)
+        return status
+
+    async def iter_pages(self, path:str, params:dict=None, endpoint:str='other', token:str=None, start_page:int=1):
+        # page numbered listings (tags), until the page without 'has_additional'
+        page = start_page
+        while True:
+            body = await self.get_json(path, params={**(params or {}), 'page': page}, endpoint=endpoint, token=token)
+            yield body
+            if not body.get('has_additional'):
+                return
+            page += 1
+
+    async def iter_next_pages(self, path:str, params:dict=None, endpoint:str='other', token:str=None):
+        # listings paginated by an opaque 'next_page' token (repositories)
+        params = dict(params or {})
+        while True:
+            body = await self.get_json(path, params=params, endpoint=endpoint, token=token)
+            yield body
+            if not body.get('next_page'):
+                return
+            params['next_page'] = body['next_page']
+
+    async def get_all_items(self, path:str, items_key:str, params:dict=None, endpoint:str='other', token:str=None, next_page:bool=False):
+        # items of all the pages of a listing, next_page selects the 'next_page' token pagination
+        items = []
+        pages = self.iter_next_pages if next_page else self.iter_pages
+        async for body in pages(path, params=params, endpoint=endpoint, token=token):
+            items += body[items_key]
+        return items
+
+    def get_stats(self):
+        return {endpoint: {**stats, 'avg_seconds': stats['seconds'] / stats['requests'] if stats['requests'] else 0.0}
+                for endpoint, stats in self.stats.items()}
+
+    def print_stats(self):
+        for endpoint, stats in sorted(self.get_stats().items()):
+            print(f'{endpoint}\trequests={stats["requests"]}\tretries={stats["retries"]}\terrors={stats["errors"]}\t'
+                  f'avg={stats["avg_seconds"]:.3f}s\tmax={stats["max_seconds"]:.3f}s')
+
+
+class blocking_quay_client:
+    # runs a quay_client on a background event loop, so that thread based tools share its pool and rate limit
+    error = quay_api_error
+    def __init__(self, **client_args):
+        self.client = quay_client(**client_args)
+        self.loop = asyncio.new_event_loop()
+        self.thread = threading.Thread(target=self.loop.run_forever, name='quay-client', daemon=True)
+        self.thread.start()
+
+    def run(self, coroutine):
+        return asyncio.run_coroutine_threadsafe(coroutine, self.loop).result()
+
+    def get_json(self, path:str, params:dict=None, endpoint:str='other', token:str=None):
+        return self.run(self.client.get_json(path, params=params, endpoint=endpoint, token=token))
+
+    def delete(self, path:str, endpoint:str='other', token:str=None):
+        return self.run(self.client.delete(path, endpoint=endpoint, token=token))
+
+    def get_all_items(self, path:str, items_key:str, params:dict=None, endpoint:str='other', token:str=None, next_page:bool=False):
+        return self.run(self.client.get_all_items(path, items_key, params=params, endpoint=endpoint, token=token, next_page=next_page))
+
+    def print_stats(self):
+        self.client.print_stats()
+
+    def close(self):
+        self.run(self.client.close())
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self.thread.join()
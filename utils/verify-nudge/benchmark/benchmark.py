@@ -0,0 +1,158 @@
+import argparse
+import hashlib
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+import yaml
+# local packages
+import fake_server
+
+
+VERIFY_NUDGE_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+MAIN_PATH = os.path.join(VERIFY_NUDGE_DIR, 'main.py')
+
+# Components per synthetic repo config, each repo config has one params.env
+COMPONENTS_PER_REPO = 10
+
+
+
+def get_digest(*parts):
+    return 'sha256:' + hashlib.sha256('/'.join(parts).encode()).hexdigest()
+
+
+
+def generate_scenario(component_count, releases, base_url):
+    """
+    Generates a synthetic config.yaml and the content the stand-in server serves for it.
+
+    Args:
+        - component_count (int): Total number of components, spread over repo configs of COMPONENTS_PER_REPO.
+        - releases (list): The releases to be verified.
+        - base_url (str): The URL of the stand-in server.
+
+    Returns:
+        - tuple: A tuple containing:
+            - configs (list): The content of config.yaml.
+            - files (dict): The raw files to be served, see `StandInData`.
+            - tags (dict): The Quay tags to be served, see `StandInData`.
+    """
+    configs = []
+    files = {}
+    tags = {}
+    repo_count = max(1, -(-component_count // COMPONENTS_PER_REPO))
+    for repo_index in range(repo_count):
+        repo_name = f'operator-{repo_index}'
+        components = [f'{repo_name}-component-{index}' for index in range(repo_index * COMPONENTS_PER_REPO, min(component_count, (repo_index + 1) * COMPONENTS_PER_REPO))]
+        configs.append({
+            'name': repo_name,
+            'repo-url': f'{base_url}/red-hat-data-services/{repo_name}.git',
+            'nudged-file-paths': ['config/params.env'],
+            'verify-components': [{'name': component} for component in components]
+        })
+        for release in releases:
+            files[f'/red-hat-data-services/{repo_name}/{release}/config/params.env'] = ''.join(
+                f'{component}=quay.io/modh/{component}@{get_digest(component, release)}\n' for component in components)
+        for component in components:
+            # Newest tags first, as listed by Quay, with some nightly tags in between
+            tags[f'modh/{component}'] = [tag for release in reversed(releases) for tag in (
+                {'name': f'{release}-nightly', 'manifest_digest': get_digest(component, release, 'nightly')},
+                {'name': release, 'manifest_digest': get_digest(component, release)})]
+    return configs, files, tags
+
+
+
+def run_scenario(component_count, releases, latency_ms, extra_args):
+    """
+    Runs verify-nudge in a subprocess against a stand-in server serving a synthetic scenario.
+
+    Returns:
+        - dict: The wall time, request count, peak RSS and exit status of the run.
+    """
+    with tempfile.TemporaryDirectory() as workdir:
+        # The server is started first, the scenario needs its URL
+        server_data = fake_server.StandInData()
+        server = fake_server.start_server(server_data, latency_ms=latency_ms)
+        base_url = f'http://127.0.0.1:{server.server_port}'
+        configs, server_data.files, server_data.tags = generate_scenario(component_count, releases, base_url)
+        config_path = os.path.join(workdir, 'config.yaml')
+        with open(config_path, 'w') as file:
+            yaml.safe_dump(configs, file)
+
+        env = dict(os.environ, VERIFY_NUDGE_QUAY_API_URL=f'{base_url}/api/v1', VERIFY_NUDGE_REGISTRY_URL=base_url)
+        command = [sys.executable, MAIN_PATH, '--config', config_path, '--releases', ','.join(releases), *extra_args]
+
+        started = time.perf_counter()
+        process = subprocess.Popen(command, cwd=workdir, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        _, status, rusage = os.wait4(process.pid, 0)
+        wall_time = time.perf_counter() - started
+        server.shutdown()
+
+        return {
+            'components': component_count,
+            'releases': len(releases),
+            'wall_time_s': round(wall_time, 3),
+            'requests': server.request_count,
+            # ru_maxrss is in kilobytes on Linux
+            'peak_rss_mb': round(rusage.ru_maxrss / 1024, 1),
+            'exit_status': os.waitstatus_to_exitcode(status)
+        }
+
+
+
+def check_regressions(results, baseline, max_regression):
+    """
+    Compares the results against a baseline.
+
+    Returns:
+        - list: Description of every wall time, request count or peak RSS regressing by more than `max_regression`.
+    """
+    baseline_results = {(result['components'], result['releases']): result for result in baseline}
+    regressions = []
+    for result in results:
+        previous = baseline_results.get((result['components'], result['releases']))
+        if not previous:
+            continue
+        for metric in ('wall_time_s', 'requests', 'peak_rss_mb'):
+            if previous[metric] and result[metric] > previous[metric] * (1 + max_regression):
+                regressions.append(f"{result['components']} components x {result['releases']} releases: "
+                                   f"{metric} {previous[metric]} -> {result[metric]}")
+    return regressions
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Benchmarks verify-nudge against a local stand-in of GitHub and Quay.')
+    parser.add_argument('--components', default='10,100,1000', required=False, help='Comma-separated list of component counts.', dest='components')
+    parser.add_argument('--releases', default=3, type=int, required=False, help='Number of releases verified in each scenario.', dest='releases')
+    parser.add_argument('--latency-ms', default=20, type=float, required=False, help='Latency added to every response of the stand-in server.', dest='latency_ms')
+    parser.add_argument('--output', required=False, help='Write the results as JSON, to be used as a later baseline.', dest='output')
+    parser.add_argument('--baseline', required=False, help='JSON results of a previous run to compare against.', dest='baseline')
+    parser.add_argument('--max-regression', default=0.2, type=float, required=False, help='Tolerated regression against the baseline, 0.2 is 20%%.', dest='max_regression')
+    args, extra_args = parser.parse_known_args()
+
+    releases = [f'rhoai-2.{minor}' for minor in range(10, 10 + args.releases)]
+    results = []
+    print(f"{'components':>10} {'releases':>8} {'wall time (s)':>13} {'requests':>8} {'peak RSS (MB)':>13} {'exit':>4}")
+    for component_count in [int(count) for count in args.components.split(',')]:
+        result = run_scenario(component_count, releases, args.latency_ms, extra_args)
+        results.append(result)
+        print(f"{result['components']:>10} {result['releases']:>8} {result['wall_time_s']:>13} {result['requests']:>8} {result['peak_rss_mb']:>13} {result['exit_status']:>4}")
+
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(results, file, indent=4)
+
+    if any(result['exit_status'] != 0 for result in results):
+        print('verify-nudge failed in at least one scenario!')
+        sys.exit(1)
+
+    if args.baseline:
+        with open(args.baseline) as file:
+            regressions = check_regressions(results, json.load(file), args.max_regression)
+        for regression in regressions:
+            print(f'Regression: {regression}')
+        if regressions:
+            sys.exit(1)
@@ -0,0 +1,176 @@
+import argparse
+import base64
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+
+QUAY_TAGS_PATH_PATTERN = re.compile(r'^/api/v1/repository/(?P<repository>.+)/tag/?$')
+REGISTRY_MANIFEST_PATH_PATTERN = re.compile(r'^/v2/(?P<repository>.+)/manifests/(?P<tag>[^/]+)$')
+REGISTRY_AUTH_PATH = '/v2/auth'
+REGISTRY_TOKEN = 'stand-in-token'
+
+
+
+class StandInData:
+    """
+    Content served by the stand-in server.
+
+    Args:
+        - files (dict): URL path -> content of the raw files, e.g. '/org/repo/rhoai-2.16/params.env'.
+        - tags (dict): Quay repository -> list of {'name', 'manifest_digest'}, newest first.
+        - fixtures_dir (str): Directory of fixtures recorded with VERIFY_NUDGE_HTTP_MODE=record,
+                              served by URL path and query regardless of the recorded host.
+    """
+
+    def __init__(self, files=None, tags=None, fixtures_dir=None):
+        self.files = files or {}
+        self.tags = tags or {}
+        self.fixtures = {}
+        if fixtures_dir and os.path.isdir(fixtures_dir):
+            for filename in os.listdir(fixtures_dir):
+                if filename.endswith('.json'):
+                    with open(os.path.join(fixtures_dir, filename)) as file:
+                        fixture = json.load(file)
+                    url = urlsplit(fixture['url'])
+                    self.fixtures[(fixture['method'], url.path, url.query)] = fixture
+
+
+
+def get_quay_tags_page(tags, query):
+    """
+    Answers a Quay tag API request ('specificTag', 'filter_tag_name', 'page' and 'limit').
+
+    Returns:
+        - dict: The JSON response of the Quay tag API.
+    """
+    specific_tag = query.get('specificTag', [None])[0]
+    if specific_tag:
+        return {'tags': [tag for tag in tags if tag['name'] == specific_tag], 'page': 1, 'has_additional': False}
+
+    name_filter = query.get('filter_tag_name', [''])[0]
+    if name_filter.startswith('like:'):
+        tags = [tag for tag in tags if name_filter[len('like:'):] in tag['name']]
+    elif name_filter.startswith('eq:'):
+        tags = [tag for tag in tags if tag['name'] == name_filter[len('eq:'):]]
+
+    page = int(query.get('page', ['1'])[0])
+    limit = int(query.get('limit', ['50'])[0])
+    start = (page - 1) * limit
+    return {'tags': tags[start:start + limit], 'page': page, 'has_additional': len(tags) > start + limit}
+
+
+
+def create_server(data, host='127.0.0.1', port=0, latency_ms=0):
+    """
+    Creates the stand-in server of raw.githubusercontent.com, of the Quay tag API and of the
+    registry v2 manifest API, which challenges anonymous requests for a bearer token.
+
+    Every response is delayed by `latency_ms`, and the number of requests served is
+    counted in `server.request_count`.
+
+    Args:
+        - data (StandInData): The content to be served.
+        - host (str): The host to listen on.
+        - port (int): The port to listen on, 0 picks a free port.
+        - latency_ms (float): Latency added to every response, in milliseconds.
+
+    Returns:
+        - ThreadingHTTPServer: The server, not started yet.
+    """
+    class StandInHandler(BaseHTTPRequestHandler):
+        protocol_version = 'HTTP/1.1'
+
+        def log_message(self, format, *args):
+            pass
+
+        def send_body(self, status, body, headers=None):
+            self.send_response(status)
+            for key, value in (headers or {}).items():
+                self.send_header(key, value)
+            self.send_header('Content-Length', str(len(body)))
+            self.end_headers()
+            if self.command != 'HEAD':
+                self.wfile.write(body)
+
+        def do_GET(self):
+            with server.lock:
+                server.request_count += 1
+            if latency_ms:
+                time.sleep(latency_ms / 1000)
+
+            url = urlsplit(self.path)
+            fixture = data.fixtures.get((self.command, url.path, url.query))
+            if fixture:
+                return self.send_body(fixture['status'], base64.b64decode(fixture['body']), fixture['headers'])
+
+            match = QUAY_TAGS_PATH_PATTERN.match(url.path)
+            if match and match.group('repository') in data.tags:
+                body = json.dumps(get_quay_tags_page(data.tags[match.group('repository')], parse_qs(url.query))).encode()
+                return self.send_body(200, body, {'Content-Type': 'application/json'})
+
+            if url.path in data.files:
+                content = data.files[url.path].encode()
+                etag = f'"{hashlib.sha1(content).hexdigest()}"'
+                if self.headers.get('If-None-Match') == etag:
+                    return self.send_body(304, b'', {'ETag': etag})
+                return self.send_body(200, content, {'Content-Type': 'text/plain', 'ETag': etag})
+
+            if url.path == REGISTRY_AUTH_PATH:
+                body = json.dumps({'token': REGISTRY_TOKEN, 'expires_in': 300}).encode()
+                return self.send_body(200, body, {'Content-Type': 'application/json'})
+
+            match = REGISTRY_MANIFEST_PATH_PATTERN.match(url.path)
+            if match and match.group('repository') in data.tags:
+                if self.headers.get('Authorization') != f'Bearer {REGISTRY_TOKEN}':
+                    challenge = (f'Bearer realm="http://{self.headers.get("Host")}{REGISTRY_AUTH_PATH}",'
+                                 f'service="stand-in",scope="repository:{match.group("repository")}:pull"')
+                    return self.send_body(401, b'', {'WWW-Authenticate': challenge})
+                for tag in data.tags[match.group('repository')]:
+                    if tag['name'] == match.group('tag'):
+                        return self.send_body(200, b'{}', {'Docker-Content-Digest': tag['manifest_digest'],
+                                                           'Content-Type': 'application/vnd.oci.image.index.v1+json'})
+
+            self.send_body(404, b'Not Found', {'Content-Type': 'text/plain'})
+
+        do_HEAD = do_GET
+
+    server = ThreadingHTTPServer((host, port), StandInHandler)
+    server.daemon_threads = True
+    server.lock = threading.Lock()
+    server.request_count = 0
+    return server
+
+
+
+def start_server(data, host='127.0.0.1', port=0, latency_ms=0):
+    """
+    Creates the stand-in server and serves it from a background thread.
+
+    Returns:
+        - ThreadingHTTPServer: The running server, stop it with `shutdown()`.
+    """
+    server = create_server(data, host, port, latency_ms)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Stand-in server of raw.githubusercontent.com and of the Quay tag API for verify-nudge.')
+    parser.add_argument('--data', required=False, help="JSON file with the 'files' and 'tags' to be served.", dest='data')
+    parser.add_argument('--fixtures-dir', required=False, help='Directory of recorded fixtures to be served.', dest='fixtures_dir')
+    parser.add_argument('--host', default='127.0.0.1', required=False, help='Host to listen on.', dest='host')
+    parser.add_argument('--port', default=8080, type=int, required=False, help='Port to listen on.', dest='port')
+    parser.add_argument('--latency-ms', default=0, type=float, required=False, help='Latency added to every response.', dest='latency_ms')
+    args = parser.parse_args()
+
+    content = json.load(open(args.data)) if args.data else {}
+    server = create_server(StandInData(content.get('files'), content.get('tags'), args.fixtures_dir), args.host, args.port, args.latency_ms)
+    print(f'Serving on http://{args.host}:{server.server_port}')
+    server.serve_forever()
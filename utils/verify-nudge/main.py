@@ -1,13 +1,65 @@
 import argparse
-from packaging.version import Version
+from concurrent.futures import ThreadPoolExecutor, as_completed
+import hashlib
 import os
+import time
 # local packages
 from util import util
+from util import download_cache
+from util import metrics
+from util import notifier
+from util import output
+from util import quay_index
+from util import report
+from util import state
+from util import verification_plan
 from validator import validator
 
 
 
-def get_rhoai_releases():
+def parse_arguments():
+    """
+    Parses the command-line arguments of the nudge verification tool.
+
+    Returns:
+        - argparse.Namespace: The parsed command-line arguments.
+    """
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--releases', default='DEFAULT', required=False, help='Comma-separated list of releases to be verified for nudges.', dest='releases')
+    parser.add_argument('--config', default='config.yaml', required=False, help='Path of the config.yaml listing the repos to be verified.', dest='config')
+    parser.add_argument('--jobs', default=1, type=int, required=False, help='Number of (release, repo config) pairs verified in parallel.', dest='jobs')
+    parser.add_argument('--concurrency', default=8, type=int, required=False, help='Maximum number of concurrent Quay digest lookups per repo config.', dest='concurrency')
+    parser.add_argument('--resolver', default=util.RESOLVER_QUAY_API, choices=util.RESOLVERS, required=False, help="Digest resolver, the Quay tag API ('quay-api') or the registry v2 manifest API ('registry').", dest='resolver')
+    parser.add_argument('--cache-dir', default=download_cache.DEFAULT_CACHE_DIR, required=False, help='Directory of the download cache, can be shared across runs and workers.', dest='cache_dir')
+    parser.add_argument('--cache-ttl', default=download_cache.DEFAULT_TTL, type=float, required=False, help='Seconds during which a cached download is served without revalidation.', dest='cache_ttl')
+    parser.add_argument('--cache-max-size', default=download_cache.DEFAULT_MAX_BYTES, type=int, required=False, help='Maximum size of the download cache in bytes.', dest='cache_max_size')
+    parser.add_argument('--state-file', default=state.DEFAULT_STATE_FILE, required=False, help='State of the previous runs, unchanged nudges which were verified are not verified again.', dest='state_file')
+    parser.add_argument('--full', action='store_true', required=False, help='Verify every nudge, ignoring the state of the previous runs.', dest='full')
+    parser.add_argument('--revalidate-after', default=state.DEFAULT_REVALIDATE_AFTER, type=float, required=False, help='Seconds during which the Quay digests of a successful verification are reused instead of being resolved again.', dest='revalidate_after')
+    parser.add_argument('--watch', action='store_true', required=False, help='Keep verifying the nudges on an adaptive interval, until interrupted.', dest='watch')
+    parser.add_argument('--watch-min-interval', default=60, type=float, required=False, help='Seconds between watch cycles right after a mismatch or a new nudge.', dest='watch_min_interval')
+    parser.add_argument('--watch-max-interval', default=900, type=float, required=False, help='Maximum seconds between watch cycles while nothing changes.', dest='watch_max_interval')
+    parser.add_argument('--watch-backoff', default=2, type=float, required=False, help='Factor by which the interval between watch cycles grows while nothing changes.', dest='watch_backoff')
+    parser.add_argument('--report', choices=report.REPORT_FORMATS, required=False, help='Write a machine-readable report of the results and timings of the run.', dest='report')
+    parser.add_argument('--report-file', required=False, help="Path of the report, 'downloads/verify-nudge-report.<json|xml>' by default.", dest='report_file')
+    args = parser.parse_args()
+
+    if args.report and not args.report_file:
+        args.report_file = os.path.join("downloads", f"verify-nudge-report.{'xml' if args.report == 'junit' else 'json'}")
+    if args.jobs < 1:
+        parser.error("'--jobs' should be a positive integer.")
+    if args.concurrency < 1:
+        parser.error("'--concurrency' should be a positive integer.")
+    if not 0 < args.watch_min_interval <= args.watch_max_interval:
+        parser.error("'--watch-min-interval' should be positive and at most '--watch-max-interval'.")
+    if args.watch_backoff < 1:
+        parser.error("'--watch-backoff' should be at least 1.")
+
+    return args
+
+
+
+def get_rhoai_releases(args):
     """
     Retrieves and validates RHOAI release versions based on command-line arguments or 
     from a remote YAML file if no arguments are provided.
@@ -17,6 +69,9 @@ def get_rhoai_releases():
     or set to 'DEFAULT', it fetches the releases from a remote YAML file, validates the content, 
     and returns the parsed data.
 
+    Args:
+        - args (argparse.Namespace): The parsed command-line arguments.
+
     Returns:
         - dict: A dictionary containing the list of validated RHOAI release versions.
 
@@ -31,12 +86,6 @@ def get_rhoai_releases():
     
     rhoai_releases = {}
     
-    # Parsing RHOAI releases value from command-line
-    parser = argparse.ArgumentParser()
-    parser.add_argument('--releases', default='DEFAULT', required=False, help='Comma-separated list of releases to be verified for nudges.', dest='releases')
-    args = parser.parse_args()
-
-    
     # Use RHOAI release versions from command-line arguments, or fetch from URL if not provided.
     if args.releases and args.releases != 'DEFAULT':
         
@@ -63,167 +112,377 @@ def get_rhoai_releases():
 
 
 
-def is_component_onboarded(release, onboarded_since):
-    """
-    Determines if a component was onboarded and nudging was enabled in the specified release version.
-
-    This function compares the release version to the `onboarded_since` version. 
-    If `onboarded_since` is provided, it checks if the release version is greater 
-    than or equal to the onboarded version. If `onboarded_since` is not provided, 
-    it assumes the component is onboarded.
-
-    Args:
-        - release (str): The release version string in the format 'rhoai-<version>'.
-        - onboarded_since (str): The version string indicating when the component 
-                               was onboarded, in the format 'rhoai-<version>'.
-
-    Returns:
-        - bool: True if the component is considered onboarded based on the release 
-              version, False otherwise.
-    """
-    if onboarded_since:
-        # Remove the 'rhoai-' prefix and compare versions
-        release_version = Version(release.replace('rhoai-', ''))
-        onboarded_version = Version(onboarded_since.replace('rhoai-', ''))
-        return release_version >= onboarded_version
-    else:
-        return True
-
-    
-    
-def is_nudging_correct(release, config):
+def is_nudging_correct(release, config, components, concurrency=8, resolver=util.RESOLVER_QUAY_API):
     """
     Verifies the integrity of nudge files by comparing the SHA values of images from 
     the nudged file against those in the Quay repository. Also checks if the image is 
     from the 'quay.io/modh' repository.
 
+    The Quay digest lookups of all the images in the nudged file are fired concurrently 
+    (bounded by `concurrency`) and gathered, the results are then printed and compared 
+    in the original order of the nudged file.
+
+    The digests recorded by the last successful verification in the state store are reused 
+    while they are recent and the nudged files are the same as in that verification (see 
+    `state.StateStore.get_trusted_digests`), otherwise every image reference is resolved. 
+    If the nudged files and the digests are the same as in that verification, the comparison 
+    is skipped and the components are reported as unchanged.
+
     Args:
         - release (str): The release version for which the nudge file should be verified.
         - config (dict): Configuration details including the name and URL paths necessary 
                          for downloading and verifying the nudged file.
+        - components (dict): Index of the components to be verified, see `CompiledRepoConfig.for_release`.
+        - concurrency (int): Maximum number of concurrent Quay digest lookups.
+        - resolver (str): The digest resolver, see `util.get_quay_image_sha`.
 
     Returns:
         - bool: True if any mismatch between the SHAs is found, False otherwise.
     """
-    nudged_file_paths = config.get('nudged-file-paths', [])
-    
-    # If multiple nudged files, Download all nugged files and merge their contents in a single file  
-    nudged_filenames = []
-    nudged_file_path = ""
-    for path in nudged_file_paths:
-        nudged_filename = f"{config.get('name')}-{release}-{os.path.basename(path)}"
-        nudged_filenames.append(nudged_filename)
-        nudged_file_url = util.get_nudged_file_download_url(config.get('repo-url'), path, release)
-        nudged_file_path = util.download_file(filename=nudged_filename, url=nudged_file_url)
+    # Download URL of each nudged file, the provenance of the nudges in error messages
+    nudged_file_urls = {path: util.get_nudged_file_download_url(config.get('repo-url'), path, release)
+                        for path in config.get('nudged-file-paths', [])}
     
-    if len(nudged_filenames) > 1:
-        nudged_file_path = util.merge_files_content(nudged_filenames, f"{config.get('name')}-{release}-merged-params.env")
-    
-    # Parse nudged file
-    params_env_list = util.parse_nudged_file(file_path=nudged_file_path)
+    # Nudged files are downloaded lazily, as the pipeline below consumes them
+    file_hashes = {}
+    def download_nudged_files():
+        for path, url in nudged_file_urls.items():
+            content = util.download_file_content(filename=f"{config.get('name')}-{release}-{os.path.basename(path)}", url=url)
+            file_hashes[path] = hashlib.sha256(content.encode()).hexdigest()
+            yield path, content
+    nudged_files = download_nudged_files()
     
+    # Collect the nudges to be verified, in the order of the nudged files
+    nudges = []
+    for record in util.iter_nudge_records(nudged_files, components):
+        
+        # Components are verified against the release tag, unless 'verify-components' says otherwise
+        image_tag, onboarded_since, onboarded = components.get(record.component_name, (release, '', True))
+        if onboarded and "quay.io/modh" not in record.image_name:
+            util.colored_print(f"ValueError: Invalid Image reference found in '{nudged_file_urls[record.source_file]}'.", "light_red")
+            print()
+            util.colored_print(f"Image '{record.image_name}' is not from 'modh' quay repo!", "red")
+            exit(1)
+        
+        nudges.append((record, image_tag, onboarded_since, onboarded))
     
-    # Create an empty list to store component names
-    component_names = []
+    # Reuse the recent digests of the last successful verification of the same nudged files, 
+    # the other image references are resolved
+    state_store = state.get_store()
+    trusted_digests, trusted_since = state_store.get_trusted_digests(release, config.get('name'), file_hashes)
+    lookups = dict.fromkeys((record.image_name, image_tag) for record, image_tag, _, onboarded in nudges if onboarded)
+    quay_shas = {lookup: trusted_digests[f"{lookup[0]}:{lookup[1]}"] for lookup in lookups if f"{lookup[0]}:{lookup[1]}" in trusted_digests}
+    resolved_at = trusted_since if quay_shas else None
+    if quay_shas:
+        util.colored_print(f"Reusing {len(quay_shas)} of {len(lookups)} Quay digests resolved by the last verification.", "cyan")
 
-    # Initialize an empty list to store component names
-    component_names = []
+    # Fire the remaining Quay digest lookups concurrently, each distinct image reference is resolved once
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        futures = {lookup: executor.submit(output.bind(util.get_quay_image_sha), *lookup, resolver) for lookup in lookups if lookup not in quay_shas}
+        quay_shas.update({lookup: future.result() for lookup, future in futures.items()})
 
-    # Check if 'verify-components' exists in the config dictionary
-    if 'verify-components' in config:
-        # Extract component names from the 'verify-components' list
-        for component in config['verify-components']:
-            component_names.append(component['name'])
+    # Skip the comparison, if nothing changed since the last successful verification
+    digests = {f"{image_name}:{image_tag}": quay_shas[(image_name, image_tag)] for image_name, image_tag in lookups}
+    if state_store.is_unchanged(release, config.get('name'), file_hashes, digests):
+        for record, image_tag, _, onboarded in nudges:
+            status = report.STATUS_UNCHANGED if onboarded else report.STATUS_SKIPPED
+            report.report.record_component(release, config.get('name'), record, image_tag, quay_shas.get((record.image_name, image_tag)), status)
+        util.colored_print(f"Nudged files and Quay digests unchanged since the last verification ({sum(onboarded for *_, onboarded in nudges)} components). Skipping nudge verification! ", "green")
+        print()
+        return False
 
     # Boolean to check if any mismatch is found
     mismatch_found = False
     
     # Compare the SHAs and print the results
-    for param in params_env_list:
-        # colored_print(f"param  : {param}", "blue")
-        
-        # Extracting details from the nudged file
-        component_name, image_name, image_sha = util.extract_nudge_details(component_names, nudged_filename, param)
-        
-        image_tag = release
-        onboarded_since = ''
-        if 'verify-components' in config:
-            # Extract component names from the 'verify-components' list
-            for component in config['verify-components']:
-                if component_name == component['name']:
-                    image_tag = component.get('image-tag', release)
-                    onboarded_since = component.get('onboarded-since', '')
-                    
+    for record, image_tag, onboarded_since, onboarded in nudges:
         
         # Skip, if the component was not onboarded in the current release
-        if not is_component_onboarded(release, onboarded_since):
-            util.colored_print(f"'[{component_name}]' nudge started in release '{onboarded_since}'. Skipping nudge verification! ", "yellow")
+        if not onboarded:
+            util.colored_print(f"'[{record.component_name}]' nudge started in release '{onboarded_since}'. Skipping nudge verification! ", "yellow")
             print()
+            report.report.record_component(release, config.get('name'), record, image_tag, None, report.STATUS_SKIPPED)
             continue
             
+        quay_sha = quay_shas[(record.image_name, image_tag)]
+
+        if quay_sha != record.image_sha:
+            color = 'red'
+            mismatch_found = True
+            report.report.record_component(release, config.get('name'), record, image_tag, quay_sha, report.STATUS_MISMATCH)
+        else:
+            color = 'green'
+            report.report.record_component(release, config.get('name'), record, image_tag, quay_sha, report.STATUS_MATCH)
             
-        if image_name:
-            if "quay.io/modh" in image_name:
-                # Fetch sha from quay
-                quay_sha = util.get_quay_image_sha(image_name, image_tag)
-
-                if quay_sha != image_sha:
-                    color = 'red'
-                    mismatch_found = True
-                else:
-                    color = 'green'
-                    
-                util.colored_print(f"Component Name  : {component_name}", color)
-                util.colored_print(f"Image Name      : {image_name}", color)
-                util.colored_print(f"Image SHA       : {image_sha.split(':')[1]}", color)
-                util.colored_print(f"Quay  SHA       : {quay_sha.split(':')[1]}", color)
-                print()
-            else:
-                util.colored_print(f"ValueError: Invalid Image reference found in '{nudged_file_url}'.", "light_red")
-                print()
-                util.colored_print(f"Image '{image_name}' is not from 'modh' quay repo!", "red")
-                exit(1)
-            
+        util.colored_print(f"Component Name  : {record.component_name}", color)
+        util.colored_print(f"Image Name      : {record.image_name}", color)
+        util.colored_print(f"Nudged File     : {record.source_file}", color)
+        util.colored_print(f"Image SHA       : {record.image_sha.split(':')[1]}", color)
+        util.colored_print(f"Quay  SHA       : {quay_sha.split(':')[1]}", color)
+        print()
+    
+    state_store.record(release, config.get('name'), file_hashes, digests, state.STATUS_MISMATCH if mismatch_found else state.STATUS_OK, resolved_at)
     return mismatch_found
 
 
 
 
 
-def main():
+def verify_release_config(release, compiled_config, concurrency, resolver):
+    """
+    Verifies the nudges of one repo config for one release.
+
+    Args:
+        - release (str): The release version for which the nudge file should be verified.
+        - compiled_config (CompiledRepoConfig): A single compiled configuration item of config.yaml.
+        - concurrency (int): Maximum number of concurrent Quay digest lookups.
+        - resolver (str): The digest resolver, see `util.get_quay_image_sha`.
+
+    Returns:
+        - bool: True if any mismatch between the SHAs is found, False otherwise.
+    """
+    config, components = compiled_config.for_release(release)
+
+    util.colored_print("===================================================================================", "white")
+    util.colored_print(text="Nudge Verification In Progress", color="white", isBold=True)
+    util.colored_print(text=f"-> Repo      : {config.get('name')}", color="white")
+    util.colored_print(text=f"-> Branch    : {release}", color="white")
+    util.colored_print(text=f"-> Repo URL  : {config.get('repo-url')}", color="white")
+    util.colored_print(text=f"-> File Path : {config.get('nudged-file-paths')}", color="white")
+    util.colored_print("===================================================================================", "white")
+    util.colored_print(text=f"\n[Debug] Config: '{config}' \n", color="magenta")
+
+    # Skip, if the component was not onboarded in the current release
+    if not compiled_config.is_onboarded(release):
+        util.colored_print(f"'[{config.get('name')}]' nudge started in release '{config.get('onboarded-since')}'. Skipping nudge verification! ", "yellow")
+        print()
+        return False
     
-    # Use RHOAI release versions from command-line arguments, or fetch from URL if not provided.
-    rhoai_releases = get_rhoai_releases()
-    util.colored_print(text=f"\n[Debug] Releases: {rhoai_releases}\n", color="magenta")
+    return is_nudging_correct(release, config, components, concurrency, resolver)
+
+
+
+def run_verification_task(release, compiled_config, concurrency, resolver):
+    """
+    Runs `verify_release_config` as an independent task, buffering everything it prints.
+
+    An error which would exit the program (exit status 1) only fails the task, so that the 
+    other tasks still run and the failure is accounted in the aggregated exit status.
+
+    Args:
+        - release (str): The release version for which the nudge file should be verified.
+        - compiled_config (CompiledRepoConfig): A single compiled configuration item of config.yaml.
+        - concurrency (int): Maximum number of concurrent Quay digest lookups.
+        - resolver (str): The digest resolver, see `util.get_quay_image_sha`.
+
+    Returns:
+        - tuple: A tuple containing:
+            - mismatch_found (bool): True if any mismatch between the SHAs is found.
+            - failed (bool): True if the verification could not be completed.
+            - output (str): Everything printed by the task.
+    """
+    mismatch_found = failed = False
+    started = time.perf_counter()
+    with output.buffered_output() as buffer:
+        try:
+            mismatch_found = verify_release_config(release, compiled_config, concurrency, resolver)
+        except SystemExit as e:
+            failed = e.code not in (None, 0)
+    metrics.metrics.record_task_timing(release, compiled_config.name, started, time.perf_counter())
+    
+    if failed:
+        report.report.record_failed_task(release, compiled_config.name, buffer.getvalue())
+    return mismatch_found, failed, buffer.getvalue()
+
+
+
+def run_verification_cycle(args, releases, compiled_configs):
+    """
+    Verifies every (release, repo config) pair once, flushing the output of each pair as it completes.
+
+    Args:
+        - args (argparse.Namespace): The parsed command-line arguments.
+        - releases (list): The releases to be verified.
+        - compiled_configs (list): The compiled configuration items of config.yaml.
+
+    Returns:
+        - tuple: A tuple containing:
+            - mismatch_found (bool): True if any mismatch between the SHAs is found.
+            - failed_tasks (int): The number of pairs whose verification could not be completed.
+            - task_count (int): The number of verified pairs.
+    """
+    started = time.perf_counter()
+    
+    # Every (release, config) pair is verified as an independent task
+    tasks = [(release, compiled_config) for release in releases for compiled_config in compiled_configs]
     
     mismatch_found = False
-    for release in rhoai_releases['releases']:
+    failed_tasks = 0
+    with ThreadPoolExecutor(max_workers=args.jobs) as executor:
+        futures = [executor.submit(run_verification_task, release, compiled_config, args.concurrency, args.resolver) for release, compiled_config in tasks]
         
-        configs = util.parse_yaml(file_path="config.yaml", release=release)
-        for config in configs:
-            
-            util.colored_print("===================================================================================", "white")
-            util.colored_print(text="Nudge Verification In Progress", color="white", isBold=True)
-            util.colored_print(text=f"-> Repo      : {config.get('name')}", color="white")
-            util.colored_print(text=f"-> Branch    : {release}", color="white")
-            util.colored_print(text=f"-> Repo URL  : {config.get('repo-url')}", color="white")
-            util.colored_print(text=f"-> File Path : {config.get('nudged-file-paths')}", color="white")
-            util.colored_print("===================================================================================", "white")
-            util.colored_print(text=f"\n[Debug] Config: '{config}' \n", color="magenta")
-    
-            if validator.validate_config_yaml(config):
-                
-                # Skip, if the component was not onboarded in the current release
-                if not is_component_onboarded(release, config.get('onboarded-since', '')):
-                    util.colored_print(f"'[{config.get('name')}]' nudge started in release '{config.get('onboarded-since')}'. Skipping nudge verification! ", "yellow")
-                    print()
-                    continue
-                
-                if is_nudging_correct(release, config):
-                    mismatch_found = True
+        # Flush the output of each task as one block, as soon as it completes
+        for future in as_completed(futures):
+            task_mismatch_found, task_failed, task_output = future.result()
+            output.flush_block(task_output)
+            mismatch_found = mismatch_found or task_mismatch_found
+            failed_tasks += task_failed
+
+    state.get_store().save()
+    
+    if args.report:
+        report.report.write(args.report, args.report_file, time.perf_counter() - started)
+        util.colored_print(f"Report written to '{args.report_file}'", "magenta")
+    
+    if failed_tasks:
+        util.colored_print(f"Nudge verification failed for {failed_tasks} of {len(tasks)} repo configs!", "red")
+    
+    return mismatch_found, failed_tasks, len(tasks)
+
+
 
+def get_mismatches():
+    """
+    Returns the mismatches recorded in the report of the current cycle.
+
+    Returns:
+        - dict: (release, repo, component, actual digest, expected digest) -> the reported component.
+    """
+    return {(component['release'], component['repo'], component['component'], component['actual_digest'], component['expected_digest']): component
+            for component in report.report.components if component['status'] == report.STATUS_MISMATCH}
+
+
+
+def emit_mismatch_events(previous_mismatches, mismatches):
+    """
+    Prints an event for every mismatch which appeared, and for every mismatch which was resolved, since the previous cycle.
+
+    Args:
+        - previous_mismatches (dict): The mismatches of the previous cycle, see `get_mismatches`.
+        - mismatches (dict): The mismatches of the current cycle.
+
+    Returns:
+        - list: The reported components of the new mismatches.
+    """
+    timestamp = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+    new_mismatches = [component for key, component in mismatches.items() if key not in previous_mismatches]
+    for component in new_mismatches:
+        util.colored_print(f"[{timestamp}] [Mismatch] {component['release']}/{component['repo']}: '{component['component']}' nudged "
+                           f"'{component['actual_digest']}' but '{component['image']}:{component['image_tag']}' is '{component['expected_digest']}'", "red")
+    for key, component in previous_mismatches.items():
+        if key not in mismatches:
+            util.colored_print(f"[{timestamp}] [Resolved] {component['release']}/{component['repo']}: '{component['component']}' nudge no longer mismatches", "green")
+    return new_mismatches
+
+
+
+def get_next_interval(interval, args, activity):
+    """
+    Returns the interval before the next watch cycle.
+
+    Right after activity (a new mismatch or a new nudge) the next cycle runs after the minimum 
+    interval, otherwise the interval backs off by `--watch-backoff` up to the maximum interval.
+
+    Args:
+        - interval (float): The interval before the current cycle, in seconds.
+        - args (argparse.Namespace): The parsed command-line arguments.
+        - activity (bool): True if a mismatch appeared or a nudged file changed during the current cycle.
+
+    Returns:
+        - float: The interval in seconds.
+    """
+    if activity:
+        return args.watch_min_interval
+    return min(interval * args.watch_backoff, args.watch_max_interval)
+
+
+
+def watch(args, compiled_configs, slack_notifier=None):
+    """
+    Verifies the nudges repeatedly, until interrupted.
+
+    The compiled config, the HTTP session, the download cache and the registry tokens are kept 
+    between cycles, the Quay tag index is cleared before every cycle so that moved tags are seen, 
+    at most `--revalidate-after` seconds after they moved. 
+    Releases are re-discovered every cycle, if the first discovery fails the process exits with 
+    status 1. The cycles are spaced by `get_next_interval`.
+    New mismatches are sent to Slack as they appear, if a notifier is given.
+
+    Args:
+        - args (argparse.Namespace): The parsed command-line arguments.
+        - compiled_configs (list): The compiled configuration items of config.yaml.
+        - slack_notifier (SlackNotifier): The notifier of the new mismatches, optional.
+    """
+    releases = None
+    mismatches = {}
+    interval = args.watch_min_interval
+    while True:
+        quay_index.tag_index.clear()
+        report.report.reset()
+        metrics.metrics.reset()
+        
+        # A failure of the first release discovery stops watching with a non-zero exit code, 
+        # a later failure doesn't, the previously discovered releases are verified
+        try:
+            releases = get_rhoai_releases(args)['releases']
+        except SystemExit:
+            if releases is None:
+                raise
+            util.colored_print("Release discovery failed, verifying the previously discovered releases.", "light_red")
+        
+        run_verification_cycle(args, releases, compiled_configs)
+        previous_mismatches, mismatches = mismatches, get_mismatches()
+        new_mismatches = emit_mismatch_events(previous_mismatches, mismatches)
+        if slack_notifier and new_mismatches:
+            slack_notifier.notify_mismatches(new_mismatches)
+        changed_files = state.get_store().pop_changed()
+        
+        # '--full' forces only the first cycle to verify everything
+        state.get_store().full = False
+        
+        interval = get_next_interval(interval, args, bool(new_mismatches or changed_files))
+        util.colored_print(f"[Watch] {len(mismatches)} mismatches, {len(changed_files)} changed repo configs. Next check in {interval:g}s.", "magenta")
+        time.sleep(interval)
+
+
+
+def main():
+    
+    args = parse_arguments()
+    download_cache.configure(cache_dir=args.cache_dir, ttl=args.cache_ttl, max_bytes=args.cache_max_size)
+    state.configure(file_path=args.state_file, full=args.full, revalidate_after=args.revalidate_after)
+    
+    # config.yaml is loaded and validated once, then instantiated for every release
+    compiled_configs = verification_plan.compile_config(args.config)
+    
+    # Mismatches are sent to Slack by a background worker, if a webhook is configured
+    webhook_url = os.getenv("SLACK_WEBHOOK")
+    slack_notifier = notifier.SlackNotifier(webhook_url) if webhook_url else None
+    
+    if args.watch:
+        try:
+            watch(args, compiled_configs, slack_notifier)
+        except KeyboardInterrupt:
+            util.colored_print("Watch stopped.", "magenta")
+            if slack_notifier:
+                slack_notifier.close()
+            return
+    
+    # Use RHOAI release versions from command-line arguments, or fetch from URL if not provided.
+    rhoai_releases = get_rhoai_releases(args)
+    util.colored_print(text=f"\n[Debug] Releases: {rhoai_releases}\n", color="magenta")
+    
+    mismatch_found, failed_tasks, _ = run_verification_cycle(args, rhoai_releases['releases'], compiled_configs)
+    
     if mismatch_found:
         util.colored_print("Mismatch Found. Sending Slack Notification! ", "red")
+        if slack_notifier:
+            slack_notifier.notify_mismatches(get_mismatches().values())
+    
+    if slack_notifier:
+        slack_notifier.close()
+    
+    if mismatch_found or failed_tasks:
         exit(1)
 
 
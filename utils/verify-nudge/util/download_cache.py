@@ -0,0 +1,195 @@
+import hashlib
+import json
+import os
+import tempfile
+import threading
+import time
+# local packages
+from util import http_client
+from util import metrics
+
+
+DEFAULT_CACHE_DIR = os.path.join("downloads", ".cache")
+
+# Seconds during which a cached file is served without revalidation. With the default of 0
+# every lookup is revalidated, which costs a '304 Not Modified' without body when unchanged.
+DEFAULT_TTL = 0
+
+# Maximum total size of the cached files, the least recently used ones are evicted beyond it
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+
+_cache = None
+_cache_lock = threading.Lock()
+
+
+
+def write_file_atomically(file_path, content):
+    """
+    Writes content to a file through a temporary file renamed over it, so that concurrent
+    readers and writers never observe a partially written file.
+
+    Args:
+        - file_path (str): The path of the file to be written.
+        - content (bytes): The content to be written.
+    """
+    directory = os.path.dirname(file_path) or "."
+    os.makedirs(directory, exist_ok=True)
+
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=".tmp-")
+    try:
+        with os.fdopen(fd, "wb") as file:
+            file.write(content)
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+
+class DownloadCache:
+    """
+    Download cache keyed by URL, shareable between concurrent workers and across runs.
+
+    Each entry is a single file holding a JSON header line (URL, ETag, Last-Modified,
+    fetch time) followed by the body, so that an entry is always replaced atomically.
+    Entries older than `ttl` are revalidated with 'If-None-Match'/'If-Modified-Since',
+    the least recently used entries are evicted once the cache grows beyond `max_bytes`.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_CACHE_DIR, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+        self.cache_dir = os.path.abspath(cache_dir)
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+
+
+    def _entry_path(self, url):
+        key = hashlib.sha256(url.encode()).hexdigest()
+        return os.path.join(self.cache_dir, f"{key}.entry")
+
+
+    def _read_entry(self, entry_path):
+        try:
+            with open(entry_path, "rb") as file:
+                header = json.loads(file.readline())
+                body = file.read()
+            return header, body
+        except (OSError, ValueError):
+            return None, None
+
+
+    def _write_entry(self, entry_path, header, body):
+        write_file_atomically(entry_path, json.dumps(header).encode() + b"\n" + body)
+
+
+    def fetch(self, url):
+        """
+        Returns the content of a URL, from the cache when it is still fresh or not modified.
+
+        Args:
+            - url (str): The URL of the file.
+
+        Returns:
+            - bytes: The content of the file.
+
+        Raises:
+            - requests.exceptions.RequestException: If the download or the revalidation fails.
+        """
+        entry_path = self._entry_path(url)
+        header, body = self._read_entry(entry_path)
+
+        if header is not None and header.get("url") == url and time.time() - header.get("fetched_at", 0) < self.ttl:
+            try:
+                # Fresh entry, mark it as recently used for the eviction
+                os.utime(entry_path)
+                metrics.metrics.increment('download_cache.hits')
+                return body
+            except FileNotFoundError:
+                # Evicted by a concurrent fetch since it was read, the file is fetched again
+                header = None
+
+        if header is not None and header.get("url") == url:
+            request_headers = {}
+            if header.get("etag"):
+                request_headers["If-None-Match"] = header["etag"]
+            if header.get("last_modified"):
+                request_headers["If-Modified-Since"] = header["last_modified"]
+
+            response = http_client.get(url, headers=request_headers)
+            if response.status_code == 304:
+                header["fetched_at"] = time.time()
+                self._write_entry(entry_path, header, body)
+                metrics.metrics.increment('download_cache.not_modified')
+                return body
+        else:
+            response = http_client.get(url)
+
+        # Raises an HTTPError if the HTTP request was unsuccessful
+        response.raise_for_status()
+        metrics.metrics.increment('download_cache.misses')
+
+        header = {
+            "url": url,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+            "fetched_at": time.time()
+        }
+        self._write_entry(entry_path, header, response.content)
+        self.evict()
+        return response.content
+
+
+    def evict(self):
+        """
+        Removes the least recently used entries until the cache fits in `max_bytes`.
+        """
+        entries = []
+        with os.scandir(self.cache_dir) as scanner:
+            for entry in scanner:
+                if entry.name.endswith(".entry"):
+                    try:
+                        stat = entry.stat()
+                    except FileNotFoundError:
+                        continue
+                    entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+        total_size = sum(size for _, size, _ in entries)
+        for _, size, entry_path in sorted(entries):
+            if total_size <= self.max_bytes:
+                break
+            try:
+                os.remove(entry_path)
+            except FileNotFoundError:
+                pass
+            total_size -= size
+
+
+
+def configure(cache_dir=DEFAULT_CACHE_DIR, ttl=DEFAULT_TTL, max_bytes=DEFAULT_MAX_BYTES):
+    """
+    Replaces the download cache shared by the process.
+
+    Args:
+        - cache_dir (str): The directory of the cache.
+        - ttl (float): Seconds during which a cached file is served without revalidation.
+        - max_bytes (int): Maximum total size of the cached files.
+    """
+    global _cache
+    with _cache_lock:
+        _cache = DownloadCache(cache_dir, ttl, max_bytes)
+
+
+
+def get_cache():
+    """
+    Returns the download cache shared by the process, creating it with the defaults on first use.
+
+    Returns:
+        - DownloadCache: The shared download cache.
+    """
+    global _cache
+    if _cache is None:
+        with _cache_lock:
+            if _cache is None:
+                _cache = DownloadCache()
+    return _cache
@@ -0,0 +1,153 @@
+import threading
+import time
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+# local packages
+from util import http_fixtures
+from util import metrics
+
+
+# (connect, read) timeouts in seconds, applied to every request which doesn't set its own
+DEFAULT_TIMEOUT = (10, 60)
+
+# Maximum number of pooled keep-alive connections per host
+MAX_CONNECTIONS_PER_HOST = 16
+
+# Maximum number of hosts for which a connection pool is kept
+MAX_POOLED_HOSTS = 10
+
+# Retries with exponential backoff (0.5s, 1s, 2s, 4s, ...) for transient failures.
+# 'Retry-After' sent with 429/503 responses takes precedence over the backoff.
+MAX_RETRIES = 5
+BACKOFF_FACTOR = 0.5
+RETRY_STATUS_CODES = (429, 500, 502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+
+class TimeoutHTTPAdapter(HTTPAdapter):
+    """
+    HTTPAdapter which applies a default timeout to every request sent through it.
+    """
+    def __init__(self, *args, timeout=DEFAULT_TIMEOUT, **kwargs):
+        self.timeout = timeout
+        super().__init__(*args, **kwargs)
+
+    def send(self, request, **kwargs):
+        if kwargs.get('timeout') is None:
+            kwargs['timeout'] = self.timeout
+        return super().send(request, **kwargs)
+
+
+
+def create_session():
+    """
+    Creates a requests session with connection pooling, per-host connection limits,
+    retries of idempotent requests with exponential backoff honoring 'Retry-After' and
+    default timeouts.
+
+    Returns:
+        - requests.Session: The configured session.
+    """
+    retry = Retry(
+        total=MAX_RETRIES,
+        backoff_factor=BACKOFF_FACTOR,
+        status_forcelist=RETRY_STATUS_CODES,
+        # POST isn't idempotent, a retried webhook call could be delivered twice. Its callers
+        # retry on their own terms, e.g. the notifier paces its retries of 429 responses.
+        allowed_methods=Retry.DEFAULT_ALLOWED_METHODS,
+        respect_retry_after_header=True,
+        # Hand the last response back to the caller, 'raise_for_status' reports it
+        raise_on_status=False
+    )
+    adapter = TimeoutHTTPAdapter(
+        max_retries=retry,
+        pool_connections=MAX_POOLED_HOSTS,
+        pool_maxsize=MAX_CONNECTIONS_PER_HOST,
+        # Wait for a free connection instead of opening more than the per-host limit
+        pool_block=True
+    )
+
+    session = requests.Session()
+    session.mount('https://', adapter)
+    session.mount('http://', adapter)
+    return session
+
+
+
+def get_session():
+    """
+    Returns the session shared by all the network calls of the process, creating it on first use.
+
+    Returns:
+        - requests.Session: The shared session.
+    """
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                _session = create_session()
+    return _session
+
+
+
+def request(method, url, **kwargs):
+    """
+    Sends an HTTP request through the shared session, recording its latency and size.
+
+    With VERIFY_NUDGE_HTTP_MODE=record every response is also saved as a fixture, with
+    VERIFY_NUDGE_HTTP_MODE=replay every request is answered from the saved fixtures.
+
+    Args:
+        - method (str): The HTTP method, e.g. 'GET', 'POST'.
+        - url (str): The URL of the request.
+        - **kwargs: Any other argument accepted by `requests.Session.request`.
+
+    Returns:
+        - requests.Response: The response of the request.
+
+    Raises:
+        - requests.exceptions.RequestException: If the request fails after all the retries.
+    """
+    started = time.perf_counter()
+    status = None
+    size = 0
+    try:
+        if http_fixtures.MODE == 'replay':
+            response = http_fixtures.replay(method, http_fixtures.get_request_url(method, url, kwargs.get('params')))
+        else:
+            response = get_session().request(method, url, **kwargs)
+            if http_fixtures.MODE == 'record':
+                http_fixtures.record(method, http_fixtures.get_request_url(method, url, kwargs.get('params')), response)
+        status = response.status_code
+        size = len(response.content)
+        return response
+    finally:
+        metrics.metrics.record_http_call(method, url, status, time.perf_counter() - started, size)
+
+
+
+def get(url, **kwargs):
+    """
+    Sends a GET request through the shared session, see `request`.
+    """
+    return request('GET', url, **kwargs)
+
+
+
+def head(url, **kwargs):
+    """
+    Sends a HEAD request through the shared session, see `request`.
+    """
+    return request('HEAD', url, **kwargs)
+
+
+
+def post(url, **kwargs):
+    """
+    Sends a POST request through the shared session, see `request`.
+    """
+    return request('POST', url, **kwargs)
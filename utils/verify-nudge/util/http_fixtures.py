@@ -0,0 +1,119 @@
+import base64
+import hashlib
+import json
+import os
+import requests
+from requests.structures import CaseInsensitiveDict
+from urllib.parse import urlsplit
+# local packages
+from util import metrics
+
+
+# 'record' saves every response as a fixture, 'replay' answers every request from the fixtures
+# without network access, any other value (default) sends the requests as usual.
+MODE = os.getenv("VERIFY_NUDGE_HTTP_MODE", "")
+FIXTURES_DIR = os.getenv("VERIFY_NUDGE_FIXTURES_DIR", "fixtures")
+
+# Headers which are not replayed, the body is stored decoded
+DROPPED_HEADERS = {'content-encoding', 'transfer-encoding', 'content-length', 'connection'}
+
+# Methods whose responses are not recorded, e.g. the webhook calls of the Slack notifier
+UNRECORDED_METHODS = {'POST'}
+
+
+
+def get_request_url(method, url, params=None):
+    """
+    Returns the URL of a request, including its query parameters.
+    """
+    return requests.Request(method, url, params=params).prepare().url
+
+
+
+def get_fixture_path(method, url):
+    """
+    Returns the path of the fixture of a request, keyed by its method and full URL.
+    """
+    key = hashlib.sha256(f"{method.upper()} {url}".encode()).hexdigest()
+    return os.path.join(FIXTURES_DIR, f"{key}.json")
+
+
+
+def is_secret_url(url):
+    """
+    Returns True if the path of a URL holds a secret, e.g. the token of a Slack webhook.
+    """
+    return urlsplit(url).path.startswith(metrics.SECRET_PATH_PREFIXES)
+
+
+
+def record(method, url, response):
+    """
+    Saves a response as the fixture of its request.
+
+    POST requests, requests to secret URLs and '304 Not Modified' responses are not saved. A 304
+    has no body, a fixture keyed by the URL only must hold the full response to be replayed into
+    a cold download cache.
+
+    Args:
+        - method (str): The HTTP method of the request.
+        - url (str): The full URL of the request, including its query parameters.
+        - response (requests.Response): The response to be saved.
+    """
+    if method.upper() in UNRECORDED_METHODS or is_secret_url(url) or response.status_code == 304:
+        return
+
+    fixture = {
+        'method': method.upper(),
+        'url': url,
+        'status': response.status_code,
+        'headers': {key: value for key, value in response.headers.items() if key.lower() not in DROPPED_HEADERS},
+        'body': base64.b64encode(response.content).decode()
+    }
+    os.makedirs(FIXTURES_DIR, exist_ok=True)
+    with open(get_fixture_path(method, url), 'w') as file:
+        json.dump(fixture, file, indent=4)
+
+
+
+def load_response(fixture):
+    """
+    Builds a requests.Response from a fixture.
+
+    Args:
+        - fixture (dict): The fixture, as saved by `record`.
+
+    Returns:
+        - requests.Response: The recorded response.
+    """
+    response = requests.Response()
+    response.status_code = fixture['status']
+    response.headers = CaseInsensitiveDict(fixture['headers'])
+    response._content = base64.b64decode(fixture['body'])
+    response.url = fixture['url']
+    response.encoding = requests.utils.get_encoding_from_headers(response.headers)
+    return response
+
+
+
+def replay(method, url):
+    """
+    Answers a request from its recorded fixture.
+
+    Args:
+        - method (str): The HTTP method of the request.
+        - url (str): The full URL of the request, including its query parameters.
+
+    Returns:
+        - requests.Response: The recorded response.
+
+    Raises:
+        - requests.exceptions.ConnectionError: If no fixture was recorded for the request.
+    """
+    fixture_path = get_fixture_path(method, url)
+    if not os.path.exists(fixture_path):
+        shown_url = metrics.redact_url(url) if is_secret_url(url) else url
+        raise requests.exceptions.ConnectionError(f"No recorded fixture for '{method.upper()} {shown_url}' in '{FIXTURES_DIR}'")
+
+    with open(fixture_path) as file:
+        return load_response(json.load(file))
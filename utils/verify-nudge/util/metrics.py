@@ -0,0 +1,175 @@
+import collections
+import threading
+from urllib.parse import urlsplit
+
+
+# Paths whose remaining segments are a secret, e.g. the token of a Slack incoming webhook
+SECRET_PATH_PREFIXES = ('/services/', '/workflows/', '/triggers/')
+
+
+
+def percentile(values, fraction):
+    """
+    Returns the nearest-rank percentile of a list of values, 0 if the list is empty.
+    """
+    if not values:
+        return 0
+    ordered = sorted(values)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+
+def redact_url(url):
+    """
+    Returns the scheme, host and path of a URL, without its credentials, query string and secret
+    path segments, so that the recorded calls can be shared without leaking e.g. a webhook token.
+    """
+    parts = urlsplit(url)
+    host = parts.hostname or ''
+    if parts.port:
+        host = f"{host}:{parts.port}"
+    path = parts.path
+    for prefix in SECRET_PATH_PREFIXES:
+        if path.startswith(prefix):
+            path = f"{prefix}<redacted>"
+            break
+    return f"{parts.scheme}://{host}{path}"
+
+
+
+class Metrics:
+    """
+    Thread-safe collector of the performance metrics of a run: the latency and size of
+    every HTTP call, cache hit/miss counters and the wall time of the verification tasks.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.http_calls = []
+        self.counters = collections.Counter()
+        self.task_timings = []
+
+
+    def record_http_call(self, method, url, status, latency, size):
+        """
+        Records one HTTP call.
+
+        Args:
+            - method (str): The HTTP method.
+            - url (str): The URL of the call, recorded redacted, see `redact_url`.
+            - status (int): The HTTP status code, None if the call failed without a response.
+            - latency (float): The latency in seconds, retries included.
+            - size (int): The number of bytes of the response body.
+        """
+        redacted_url = redact_url(url)
+        call = {'method': method, 'host': urlsplit(redacted_url).netloc, 'url': redacted_url, 'status': status,
+                'latency_ms': round(latency * 1000, 3), 'bytes': size}
+        with self._lock:
+            self.http_calls.append(call)
+
+
+    def increment(self, counter, value=1):
+        """
+        Increments a counter, e.g. 'download_cache.hits'.
+        """
+        with self._lock:
+            self.counters[counter] += value
+
+
+    def record_task_timing(self, release, repo, started, finished):
+        """
+        Records the wall time of the verification of a repo for a release.
+
+        Args:
+            - release (str): The verified release.
+            - repo (str): The name of the verified repo.
+            - started (float): `time.perf_counter()` when the verification started.
+            - finished (float): `time.perf_counter()` when the verification finished.
+        """
+        timing = {'release': release, 'repo': repo, 'wall_time_s': round(finished - started, 3),
+                  'started': started, 'finished': finished}
+        with self._lock:
+            self.task_timings.append(timing)
+
+
+    def get_counters(self):
+        """
+        Returns the counters collected so far.
+        """
+        with self._lock:
+            return dict(self.counters)
+
+
+    def get_http_calls(self):
+        """
+        Returns the HTTP calls recorded so far.
+        """
+        with self._lock:
+            return list(self.http_calls)
+
+
+    def get_http_summary(self):
+        """
+        Summarizes the HTTP calls per host.
+
+        Returns:
+            - dict: host -> {'requests', 'errors', 'bytes', 'total_ms', 'avg_ms', 'p95_ms', 'max_ms'}.
+        """
+        calls = self.get_http_calls()
+
+        latencies_by_host = collections.defaultdict(list)
+        summary = {}
+        for call in calls:
+            host_summary = summary.setdefault(call['host'], {'requests': 0, 'errors': 0, 'bytes': 0})
+            host_summary['requests'] += 1
+            host_summary['bytes'] += call['bytes']
+            if call['status'] is None or call['status'] >= 400:
+                host_summary['errors'] += 1
+            latencies_by_host[call['host']].append(call['latency_ms'])
+
+        for host, latencies in latencies_by_host.items():
+            summary[host].update({
+                'total_ms': round(sum(latencies), 3),
+                'avg_ms': round(sum(latencies) / len(latencies), 3),
+                'p95_ms': percentile(latencies, 0.95),
+                'max_ms': max(latencies)
+            })
+        return summary
+
+
+    def get_repo_timings(self):
+        """
+        Returns the wall time in seconds of each (release, repo) verification.
+        """
+        with self._lock:
+            return [{key: timing[key] for key in ('release', 'repo', 'wall_time_s')} for timing in self.task_timings]
+
+
+    def get_release_timings(self):
+        """
+        Returns the wall time in seconds of each release, from the start of its first repo
+        verification to the end of its last one, so that parallel verifications aren't summed.
+        """
+        with self._lock:
+            timings = list(self.task_timings)
+
+        release_spans = {}
+        for timing in timings:
+            started, finished = release_spans.get(timing['release'], (timing['started'], timing['finished']))
+            release_spans[timing['release']] = (min(started, timing['started']), max(finished, timing['finished']))
+        return {release: round(finished - started, 3) for release, (started, finished) in release_spans.items()}
+
+
+    def reset(self):
+        """
+        Drops everything collected so far.
+        """
+        with self._lock:
+            self.http_calls = []
+            self.counters = collections.Counter()
+            self.task_timings = []
+
+
+
+# Metrics shared by the whole process
+metrics = Metrics()
@@ -0,0 +1,167 @@
+import queue
+import threading
+import time
+# local packages
+from util import http_client
+from util import metrics
+from util import util
+
+
+# Slack truncates the 'text' of a message beyond 40000 characters and renders long messages
+# poorly, a digest is split into messages of at most this many characters.
+MAX_MESSAGE_LENGTH = 3500
+
+# Incoming webhooks accept about one message per second, with short bursts
+MESSAGES_PER_SECOND = 1
+MESSAGE_BURST = 2
+
+# Attempts to deliver a message rate-limited by Slack (429), waiting 'Retry-After' in between
+MAX_ATTEMPTS = 5
+DEFAULT_RETRY_AFTER = 30
+
+
+
+class TokenBucket:
+    """
+    Token bucket pacing the calls to a rate-limited API, safe to use from multiple threads.
+
+    Args:
+        - rate (float): Tokens added per second.
+        - capacity (int): Maximum number of tokens, i.e. the allowed burst.
+    """
+
+    def __init__(self, rate, capacity):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated_at = time.monotonic()
+        self._lock = threading.Lock()
+
+
+    def acquire(self):
+        """
+        Takes a token, waiting until one is available.
+        """
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+                self.updated_at = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+
+def build_digest_messages(release, mismatches):
+    """
+    Builds the Slack messages reporting the mismatches of a release, one digest split in
+    as many messages as needed to stay under MAX_MESSAGE_LENGTH.
+
+    Args:
+        - release (str): The release of the mismatches.
+        - mismatches (list): The mismatched components, as recorded in the report.
+
+    Returns:
+        - list: The texts of the messages.
+    """
+    header = f"🚨 *Nudge Mismatches Detected in `{release}`!* ({len(mismatches)} components)"
+    lines = [f"• `{mismatch['repo']}` / `{mismatch['component']}`: nudged `{mismatch['actual_digest']}`, "
+             f"`{mismatch['image']}:{mismatch['image_tag']}` is `{mismatch['expected_digest']}`"
+             for mismatch in mismatches]
+
+    # Room is kept for the ' [<part>/<parts>]' suffix of the header of a split digest
+    header_length = len(header) + len(" [99/99]")
+    chunks = [[]]
+    length = header_length
+    for line in lines:
+        if chunks[-1] and length + len(line) + 1 > MAX_MESSAGE_LENGTH:
+            chunks.append([])
+            length = header_length
+        chunks[-1].append(line)
+        length += len(line) + 1
+
+    if len(chunks) == 1:
+        return ["\n".join([header, *chunks[0], "Please investigate this discrepancy."])]
+    return ["\n".join([f"{header} [{index}/{len(chunks)}]", *chunk]) for index, chunk in enumerate(chunks, start=1)]
+
+
+
+class SlackNotifier:
+    """
+    Queue of Slack notifications, delivered by a background worker.
+
+    Mismatches are coalesced into one digest per release (split if too long), so that a run
+    costs one webhook call per release however many components mismatch. The calls are paced
+    by a token bucket, and messages rate-limited by Slack are retried after 'Retry-After'.
+
+    Args:
+        - webhook_url (str): The URL of the Slack incoming webhook.
+    """
+
+    def __init__(self, webhook_url):
+        self.webhook_url = webhook_url
+        self.bucket = TokenBucket(MESSAGES_PER_SECOND, MESSAGE_BURST)
+        self._queue = queue.Queue()
+        self._worker = threading.Thread(target=self._run, name='slack-notifier', daemon=True)
+        self._worker.start()
+
+
+    def _send(self, message):
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            self.bucket.acquire()
+            response = http_client.post(self.webhook_url, json={"text": message}, headers={'Content-Type': 'application/json'})
+            if response.status_code == 200:
+                metrics.metrics.increment('notifier.sent')
+                return
+            if response.status_code != 429 or attempt == MAX_ATTEMPTS:
+                raise ValueError(f"Request to Slack returned an error {response.status_code}, the response is:\n{response.text}")
+            metrics.metrics.increment('notifier.rate_limited')
+            time.sleep(float(response.headers.get('Retry-After', DEFAULT_RETRY_AFTER)))
+
+
+    def _run(self):
+        while True:
+            message = self._queue.get()
+            try:
+                if message is None:
+                    return
+                self._send(message)
+            except Exception as e:
+                metrics.metrics.increment('notifier.failed')
+                util.colored_print("An error occured while sending a Slack notification.", "light_red")
+                util.colored_print(e, "red")
+            finally:
+                self._queue.task_done()
+
+
+    def notify_mismatches(self, mismatches):
+        """
+        Queues the digests of mismatched components, one per release.
+
+        Args:
+            - mismatches (list): The mismatched components, as recorded in the report.
+        """
+        releases = {}
+        for mismatch in mismatches:
+            releases.setdefault(mismatch['release'], []).append(mismatch)
+        for release, release_mismatches in releases.items():
+            for message in build_digest_messages(release, release_mismatches):
+                self._queue.put(message)
+
+
+    def flush(self):
+        """
+        Waits until all the queued notifications are delivered, or failed.
+        """
+        self._queue.join()
+
+
+    def close(self):
+        """
+        Delivers the queued notifications and stops the worker.
+        """
+        self._queue.put(None)
+        self._worker.join()
@@ -0,0 +1,106 @@
+import contextlib
+import functools
+import io
+import sys
+import threading
+
+
+
+class ThreadLocalStdout:
+    """
+    Replacement of 'sys.stdout' which writes to the buffer of the current thread, if one is
+    set through `buffered_output`, and to the original stream otherwise.
+    """
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+
+    def get_buffer(self):
+        return getattr(self.local, 'buffer', None)
+
+    def set_buffer(self, buffer):
+        self.local.buffer = buffer
+
+    def write(self, text):
+        buffer = self.get_buffer()
+        return (buffer if buffer is not None else self.stream).write(text)
+
+    def flush(self):
+        if self.get_buffer() is None:
+            self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+
+
+def install():
+    """
+    Installs the thread-aware stdout, once per process.
+
+    Returns:
+        - ThreadLocalStdout: The installed stdout.
+    """
+    if not isinstance(sys.stdout, ThreadLocalStdout):
+        sys.stdout = ThreadLocalStdout(sys.stdout)
+    return sys.stdout
+
+
+
+@contextlib.contextmanager
+def buffered_output():
+    """
+    Context manager which buffers everything the current thread prints, so that it can be
+    flushed later as one block without interleaving with the output of other threads.
+
+    Yields:
+        - io.StringIO: The buffer of the printed text.
+    """
+    stdout = install()
+    previous_buffer = stdout.get_buffer()
+    buffer = io.StringIO()
+    stdout.set_buffer(buffer)
+    try:
+        yield buffer
+    finally:
+        stdout.set_buffer(previous_buffer)
+
+
+
+def bind(function):
+    """
+    Binds a function to the output buffer of the calling thread, so that whatever it prints
+    from a worker thread lands in the same block as the output of the caller.
+
+    Args:
+        - function (callable): The function to be run in another thread.
+
+    Returns:
+        - callable: The wrapped function.
+    """
+    buffer = install().get_buffer()
+
+    @functools.wraps(function)
+    def wrapper(*args, **kwargs):
+        stdout = install()
+        previous_buffer = stdout.get_buffer()
+        stdout.set_buffer(buffer)
+        try:
+            return function(*args, **kwargs)
+        finally:
+            stdout.set_buffer(previous_buffer)
+    return wrapper
+
+
+
+def flush_block(text):
+    """
+    Writes a block of buffered text to the original stdout in one piece.
+
+    Args:
+        - text (str): The block to be written.
+    """
+    stdout = install()
+    stdout.stream.write(text)
+    stdout.stream.flush()
@@ -0,0 +1,188 @@
+import os
+import threading
+# local packages
+from util import http_client
+from util import metrics
+
+
+QUAY_API_URL = os.getenv("VERIFY_NUDGE_QUAY_API_URL", "https://quay.io/api/v1")
+QUAY_API_TOKEN = "TOKEN" # Maybe a bug, but any arbitrary value works
+
+# Page size and maximum number of pages fetched while indexing the tags of a repository
+TAGS_PAGE_LIMIT = 100
+MAX_TAG_PAGES = 50
+
+# Number of pages a repository is expected to be indexed in, until it has been indexed once.
+# A repository with more than one page is only indexed once more of its tags are looked up
+# than it has pages left, the first tags missing from its first page are looked up one by one.
+EXPECTED_TAG_PAGES = 5
+
+# Only the RHOAI release tags (rhoai-X.Y, rhoai-X.Y-cuda, ...) are indexed, the nightly
+# and commit tags of a repository are not looked up by verify-nudge.
+TAG_NAME_FILTER = "like:rhoai-"
+
+
+
+def fetch_tags(repository, params):
+    """
+    Fetches one page of tags of a Quay repository.
+
+    Args:
+        - repository (str): The repository path without the 'quay.io/' prefix, e.g. 'modh/vllm'.
+        - params (dict): Query parameters of the Quay tag API.
+
+    Returns:
+        - dict: The decoded JSON response, containing the 'tags' list and the 'has_additional' flag.
+
+    Raises:
+        - requests.exceptions.RequestException: If the request fails.
+        - Exception: If the JSON response has an unexpected structure.
+    """
+    url = f"{QUAY_API_URL}/repository/{repository}/tag/"
+    headers = {
+        "Authorization": f"Bearer {QUAY_API_TOKEN}"
+    }
+
+    response = http_client.get(url, params=params, headers=headers)
+    response.raise_for_status()
+
+    tags = response.json()
+    if not isinstance(tags, dict):
+        raise Exception("Error: Unexpected JSON response structure")
+    return tags
+
+
+
+class RepositoryTagIndex:
+    """
+    In-memory index of the active tags of Quay repositories.
+
+    The first lookup of a repository fetches the first page of its active tags, which
+    indexes most repositories. Otherwise the tags missing from the first page are looked up
+    one by one with a targeted 'specificTag' lookup, until more tags of the repository are
+    needed than it has pages left (EXPECTED_TAG_PAGES until it has been indexed once); its
+    remaining pages are then fetched and every later `(repository, tag) -> manifest_digest`
+    lookup is answered from memory. Tags missing from the index fall back to a 'specificTag'
+    lookup. The index is safe to use from multiple threads, a repository is indexed only once.
+    """
+
+    def __init__(self):
+        self._indexes = {}
+        self._partial_indexes = {}
+        self._specific_lookups = {}
+        self._page_counts = {}
+        self._repo_locks = {}
+        self._lock = threading.Lock()
+
+
+    def _get_repo_lock(self, repository):
+        with self._lock:
+            return self._repo_locks.setdefault(repository, threading.Lock())
+
+
+    def _fetch_pages(self, repository, index, first_page, last_page):
+        # Adds the tags of the pages to the index, returns the number of the last fetched page
+        # and whether the repository has more pages
+        for page in range(first_page, last_page + 1):
+            params = {"onlyActiveTags": "true", "limit": TAGS_PAGE_LIMIT, "page": page, "filter_tag_name": TAG_NAME_FILTER}
+            tags = fetch_tags(repository, params)
+            for tag in tags.get('tags', []):
+                index.setdefault(tag.get('name'), tag.get('manifest_digest'))
+            if not tags.get('has_additional'):
+                return page, False
+        return last_page, True
+
+
+    def _set_index(self, repository, index, page_count):
+        self._indexes[repository] = index
+        self._page_counts[repository] = page_count
+        self._partial_indexes.pop(repository, None)
+        metrics.metrics.increment('tag_index.repositories')
+        return index
+
+
+    def _fetch_tag(self, repository, tag):
+        tags = fetch_tags(repository, {"specificTag": tag, "onlyActiveTags": "true"})
+        for tag_details in tags.get('tags', []):
+            if tag_details.get('name') == tag:
+                return tag_details.get('manifest_digest')
+        return None
+
+
+    def _lookup_unindexed(self, repository, tag):
+        # Called with the lock of the repository held, until the repository is indexed.
+        # Returns the tags known so far, the whole index once the repository is indexed.
+        partial_index = self._partial_indexes.get(repository)
+        if partial_index is None:
+            partial_index = {}
+            _, has_additional = self._fetch_pages(repository, partial_index, 1, 1)
+            if not has_additional:
+                return self._set_index(repository, partial_index, 1)
+            self._partial_indexes[repository] = partial_index
+            self._specific_lookups[repository] = 0
+
+        if tag in partial_index:
+            metrics.metrics.increment('tag_index.hits')
+            return partial_index
+
+        # Fewer tags needed so far than the pages left, look the tag up alone
+        if self._specific_lookups[repository] < self._page_counts.get(repository, EXPECTED_TAG_PAGES) - 1:
+            self._specific_lookups[repository] += 1
+            metrics.metrics.increment('tag_index.specific_lookups')
+            manifest_digest = self._fetch_tag(repository, tag)
+            if manifest_digest:
+                partial_index[tag] = manifest_digest
+            return partial_index
+
+        page_count, _ = self._fetch_pages(repository, partial_index, 2, MAX_TAG_PAGES)
+        return self._set_index(repository, partial_index, page_count)
+
+
+    def get_manifest_digest(self, repository, tag):
+        """
+        Returns the manifest digest of a tag of a Quay repository.
+
+        Args:
+            - repository (str): The repository path without the 'quay.io/' prefix, e.g. 'modh/vllm'.
+            - tag (str): The tag whose manifest digest is required.
+
+        Returns:
+            - str: The manifest digest of the tag, or None if the tag is not found.
+
+        Raises:
+            - requests.exceptions.RequestException: If a request to Quay fails.
+            - Exception: If a JSON response has an unexpected structure.
+        """
+        with self._get_repo_lock(repository):
+            index = self._indexes.get(repository)
+            if index is None:
+                index = self._lookup_unindexed(repository, tag)
+                if repository not in self._indexes:
+                    return index.get(tag)
+
+            if tag in index:
+                metrics.metrics.increment('tag_index.hits')
+                return index[tag]
+
+            # Index miss, e.g. the tag was pushed after the repository was indexed
+            metrics.metrics.increment('tag_index.misses')
+            manifest_digest = self._fetch_tag(repository, tag)
+            if manifest_digest:
+                index[tag] = manifest_digest
+            return manifest_digest
+
+
+    def clear(self):
+        """
+        Drops all the indexed repositories and looked up tags, the next lookups fetch them again.
+        The number of pages of the indexed repositories is kept.
+        """
+        with self._lock:
+            self._indexes.clear()
+            self._partial_indexes.clear()
+            self._specific_lookups.clear()
+
+
+
+# Index shared by all the lookups of the process
+tag_index = RepositoryTagIndex()
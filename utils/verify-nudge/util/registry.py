@@ -0,0 +1,225 @@
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import hashlib
+import os
+import re
+import sys
+import threading
+import time
+# local packages
+from util import http_client
+from util import metrics
+
+
+# Every registry is reached through this URL instead of 'https://<registry>' when set,
+# e.g. to resolve the digests against a local stand-in registry.
+REGISTRY_URL_OVERRIDE = os.getenv("VERIFY_NUDGE_REGISTRY_URL", "")
+
+# Accepted manifest types, the manifest lists / image indexes first so that the digest of a
+# multi-arch image is the digest of its index, as reported by 'skopeo inspect' and by Quay.
+MANIFEST_MEDIA_TYPES = [
+    "application/vnd.oci.image.index.v1+json",
+    "application/vnd.docker.distribution.manifest.list.v2+json",
+    "application/vnd.oci.image.manifest.v1+json",
+    "application/vnd.docker.distribution.manifest.v2+json",
+]
+
+# Docker Hub images are referenced without registry, and official images without namespace
+DOCKER_HUB_REGISTRIES = ("docker.io", "index.docker.io")
+DOCKER_HUB_REGISTRY_URL = "registry-1.docker.io"
+
+# Lifetime assumed for a bearer token which doesn't state its 'expires_in', and the margin
+# before its expiry from which it's not reused anymore
+DEFAULT_TOKEN_TTL = 60
+TOKEN_EXPIRY_MARGIN = 10
+
+AUTH_PARAM_PATTERN = re.compile(r'(\w+)="([^"]*)"')
+
+
+
+def parse_image_reference(image_name):
+    """
+    Splits an image name into its registry and repository.
+
+    Args:
+        - image_name (str): The image name without tag or digest, e.g. 'quay.io/modh/vllm'.
+
+    Returns:
+        - tuple: The registry host (e.g. 'quay.io') and the repository (e.g. 'modh/vllm').
+    """
+    registry, _, repository = image_name.partition('/')
+    if not repository or ('.' not in registry and ':' not in registry and registry != 'localhost'):
+        registry, repository = DOCKER_HUB_REGISTRIES[0], image_name
+    if registry in DOCKER_HUB_REGISTRIES:
+        registry = DOCKER_HUB_REGISTRY_URL
+        if '/' not in repository:
+            repository = f"library/{repository}"
+    return registry, repository
+
+
+
+def parse_auth_challenge(header):
+    """
+    Parses a 'WWW-Authenticate' header of a registry.
+
+    Args:
+        - header (str): The header, e.g. 'Bearer realm="https://quay.io/v2/auth",service="quay.io",scope="repository:modh/vllm:pull"'.
+
+    Returns:
+        - tuple: The scheme (e.g. 'bearer') and a dictionary of its parameters.
+    """
+    scheme, _, params = header.strip().partition(' ')
+    return scheme.lower(), dict(AUTH_PARAM_PATTERN.findall(params))
+
+
+
+class RegistryClient:
+    """
+    Resolves the manifest digests of image tags with the registry v2 API.
+
+    A digest is read from the 'Docker-Content-Digest' header of a single
+    `HEAD /v2/<repository>/manifests/<tag>`, without pulling the manifest, the config
+    blob or the tag list as 'skopeo inspect' does. Anonymous bearer tokens are requested
+    on the registry's challenge and cached per (registry, scope) until they expire, so
+    the lookups of a repository share one token. The client is safe to use from multiple
+    threads.
+    """
+
+    def __init__(self):
+        self._tokens = {}
+        self._lock = threading.Lock()
+
+
+    def _get_registry_url(self, registry):
+        return REGISTRY_URL_OVERRIDE.rstrip('/') or f"https://{registry}"
+
+
+    def _get_cached_token(self, registry, scope):
+        with self._lock:
+            token, expires_at = self._tokens.get((registry, scope), (None, 0))
+        return token if time.monotonic() < expires_at else None
+
+
+    def _request_token(self, registry, challenge):
+        """
+        Requests an anonymous bearer token answering the challenge of a registry, and caches it.
+
+        Raises:
+            - requests.exceptions.RequestException: If the token request fails.
+            - Exception: If the challenge or the token response are unexpected.
+        """
+        scheme, params = parse_auth_challenge(challenge)
+        if scheme != 'bearer' or 'realm' not in params:
+            raise Exception(f"Error: Unsupported authentication challenge '{challenge}' from registry '{registry}'")
+
+        query = {key: params[key] for key in ('service', 'scope') if key in params}
+        response = http_client.get(params['realm'], params=query)
+        response.raise_for_status()
+
+        body = response.json()
+        token = body.get('token') or body.get('access_token')
+        if not token:
+            raise Exception(f"Error: No token in the response of '{params['realm']}'")
+
+        expires_at = time.monotonic() + int(body.get('expires_in') or DEFAULT_TOKEN_TTL) - TOKEN_EXPIRY_MARGIN
+        with self._lock:
+            self._tokens[(registry, params.get('scope', ''))] = (token, expires_at)
+        metrics.metrics.increment('registry.tokens')
+        return token
+
+
+    def get_manifest_digest(self, image_name, tag):
+        """
+        Returns the manifest digest of an image tag.
+
+        Args:
+            - image_name (str): The image name without tag, e.g. 'quay.io/modh/vllm'.
+            - tag (str): The tag whose manifest digest is required.
+
+        Returns:
+            - str: The manifest digest of the tag, e.g. 'sha256:...', or None if the tag is not found.
+
+        Raises:
+            - requests.exceptions.RequestException: If a request to the registry fails.
+            - Exception: If the registry sends an unexpected authentication challenge or response.
+        """
+        registry, repository = parse_image_reference(image_name)
+        url = f"{self._get_registry_url(registry)}/v2/{repository}/manifests/{tag}"
+        headers = {"Accept": ", ".join(MANIFEST_MEDIA_TYPES)}
+
+        token = self._get_cached_token(registry, f"repository:{repository}:pull")
+        if token:
+            headers["Authorization"] = f"Bearer {token}"
+
+        response = http_client.head(url, headers=headers)
+        if response.status_code == 401 and 'WWW-Authenticate' in response.headers:
+            headers["Authorization"] = f"Bearer {self._request_token(registry, response.headers['WWW-Authenticate'])}"
+            response = http_client.head(url, headers=headers)
+
+        if response.status_code == 404:
+            return None
+        response.raise_for_status()
+
+        digest = response.headers.get('Docker-Content-Digest')
+        if not digest:
+            # Some registries only send the digest with the manifest, it's then the digest of its body
+            metrics.metrics.increment('registry.manifest_fetches')
+            response = http_client.get(url, headers=headers)
+            response.raise_for_status()
+            digest = response.headers.get('Docker-Content-Digest') or f"sha256:{hashlib.sha256(response.content).hexdigest()}"
+        return digest
+
+
+    def resolve_many(self, references, concurrency=8):
+        """
+        Resolves the manifest digests of many image tags concurrently.
+
+        Args:
+            - references (list): (image_name, tag) tuples, duplicates are resolved once.
+            - concurrency (int): Maximum number of concurrent lookups.
+
+        Returns:
+            - dict: (image_name, tag) -> manifest digest, or None if the tag is not found.
+
+        Raises:
+            - requests.exceptions.RequestException: If a request to a registry fails.
+            - Exception: If a registry sends an unexpected authentication challenge or response.
+        """
+        references = list(dict.fromkeys(references))
+        with ThreadPoolExecutor(max_workers=concurrency) as executor:
+            digests = executor.map(lambda reference: self.get_manifest_digest(*reference), references)
+            return dict(zip(references, digests))
+
+
+    def clear(self):
+        """
+        Drops all the cached tokens.
+        """
+        with self._lock:
+            self._tokens.clear()
+
+
+
+# Client shared by all the lookups of the process
+registry_client = RegistryClient()
+
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description='Resolves the manifest digests of image tags with the registry v2 API, e.g. `python -m util.registry quay.io/modh/vllm:rhoai-2.16`.')
+    parser.add_argument('images', nargs='+', help='Image references, as <image>:<tag>.')
+    parser.add_argument('--concurrency', default=8, type=int, required=False, help='Maximum number of concurrent lookups.', dest='concurrency')
+    args = parser.parse_args()
+
+    references = []
+    for image in args.images:
+        image_name, separator, tag = image.rpartition(':')
+        if not separator or '/' in tag:
+            image_name, tag = image, 'latest'
+        references.append((image_name, tag))
+
+    digests = registry_client.resolve_many(references, args.concurrency)
+    for (image_name, tag), digest in digests.items():
+        print(f"{image_name}:{tag} {digest or 'NOT_FOUND'}")
+    if not all(digests.values()):
+        sys.exit(1)
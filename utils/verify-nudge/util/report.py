@@ -0,0 +1,195 @@
+import json
+import os
+import re
+import threading
+import time
+import xml.etree.ElementTree as ET
+# local packages
+from util import metrics
+
+
+REPORT_FORMATS = ['json', 'junit']
+
+# Statuses of a verified component
+STATUS_MATCH = 'match'
+STATUS_MISMATCH = 'mismatch'
+STATUS_SKIPPED = 'skipped'
+# Not compared again, the nudge and the Quay digest are unchanged since the last successful verification
+STATUS_UNCHANGED = 'unchanged'
+
+# ANSI escape sequences of the colored output, stripped from the reports
+ANSI_ESCAPE_PATTERN = re.compile(r'\033\[[0-9;]*m')
+
+
+
+class Report:
+    """
+    Thread-safe collector of the verification results of a run, written as a
+    machine-readable JSON or JUnit report along with the collected metrics.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.components = []
+        self.failed_tasks = []
+
+
+    def record_component(self, release, repo, record, image_tag, quay_sha, status):
+        """
+        Records the verification result of a component.
+
+        Args:
+            - release (str): The verified release.
+            - repo (str): The name of the repo config.
+            - record (NudgeRecord): The nudge of the component.
+            - image_tag (str): The Quay tag the nudge was verified against.
+            - quay_sha (str): The digest of the tag in Quay, None if not looked up.
+            - status (str): One of 'match', 'mismatch', 'skipped' or 'unchanged'.
+        """
+        result = {
+            'release': release,
+            'repo': repo,
+            'component': record.component_name,
+            'image': record.image_name,
+            'source_file': record.source_file,
+            'image_tag': image_tag,
+            'expected_digest': quay_sha,
+            'actual_digest': record.image_sha,
+            'status': status
+        }
+        with self._lock:
+            self.components.append(result)
+
+
+    def record_failed_task(self, release, repo, output):
+        """
+        Records a (release, repo) verification which could not be completed.
+
+        Args:
+            - release (str): The verified release.
+            - repo (str): The name of the repo config.
+            - output (str): Everything printed by the verification, describing the error.
+        """
+        with self._lock:
+            self.failed_tasks.append({'release': release, 'repo': repo, 'output': ANSI_ESCAPE_PATTERN.sub('', output)})
+
+
+    def to_dict(self, wall_time):
+        """
+        Returns the report as a dictionary.
+
+        Args:
+            - wall_time (float): The total wall time of the run in seconds.
+        """
+        with self._lock:
+            components = list(self.components)
+            failed_tasks = list(self.failed_tasks)
+
+        collected_metrics = metrics.metrics
+        return {
+            'generated_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime()),
+            'summary': {
+                'components': len(components),
+                'match': sum(1 for component in components if component['status'] == STATUS_MATCH),
+                'mismatch': sum(1 for component in components if component['status'] == STATUS_MISMATCH),
+                'skipped': sum(1 for component in components if component['status'] == STATUS_SKIPPED),
+                'unchanged': sum(1 for component in components if component['status'] == STATUS_UNCHANGED),
+                'failed_tasks': len(failed_tasks)
+            },
+            'components': components,
+            'failed_tasks': failed_tasks,
+            'timing': {
+                'wall_time_s': round(wall_time, 3),
+                'releases': collected_metrics.get_release_timings(),
+                'repos': collected_metrics.get_repo_timings(),
+                'http': collected_metrics.get_http_summary(),
+                'http_calls': collected_metrics.get_http_calls(),
+                'cache': collected_metrics.get_counters()
+            }
+        }
+
+
+    def write_json(self, file_path, wall_time):
+        """
+        Writes the report as JSON.
+        """
+        with open(file_path, 'w') as file:
+            json.dump(self.to_dict(wall_time), file, indent=4)
+
+
+    def write_junit(self, file_path, wall_time):
+        """
+        Writes the report as JUnit XML: one test suite per (release, repo), one test case per component.
+        The HTTP and cache metrics are written as properties of the root element.
+        """
+        report = self.to_dict(wall_time)
+        repo_timings = {(timing['release'], timing['repo']): timing['wall_time_s'] for timing in report['timing']['repos']}
+
+        suites = {}
+        for component in report['components']:
+            suites.setdefault((component['release'], component['repo']), []).append(component)
+        for task in report['failed_tasks']:
+            suites.setdefault((task['release'], task['repo']), [])
+
+        testsuites = ET.Element('testsuites', name='verify-nudge', time=str(report['timing']['wall_time_s']))
+        properties = ET.SubElement(testsuites, 'properties')
+        for host, host_summary in report['timing']['http'].items():
+            for key, value in host_summary.items():
+                ET.SubElement(properties, 'property', name=f'http.{host}.{key}', value=str(value))
+        for counter, value in report['timing']['cache'].items():
+            ET.SubElement(properties, 'property', name=counter, value=str(value))
+
+        for (release, repo), components in suites.items():
+            failed_tasks = [task for task in report['failed_tasks'] if task['release'] == release and task['repo'] == repo]
+            testsuite = ET.SubElement(testsuites, 'testsuite', name=f'{release}/{repo}',
+                                      tests=str(len(components) + len(failed_tasks)),
+                                      failures=str(sum(1 for component in components if component['status'] == STATUS_MISMATCH)),
+                                      errors=str(len(failed_tasks)),
+                                      skipped=str(sum(1 for component in components if component['status'] == STATUS_SKIPPED)),
+                                      time=str(repo_timings.get((release, repo), 0)))
+            for component in components:
+                testcase = ET.SubElement(testsuite, 'testcase', classname=f'{release}.{repo}', name=component['component'])
+                if component['status'] == STATUS_MISMATCH:
+                    failure = ET.SubElement(testcase, 'failure', message='Nudged digest does not match the Quay digest')
+                    failure.text = (f"image: {component['image']}:{component['image_tag']}\n"
+                                    f"nudged file: {component['source_file']}\n"
+                                    f"expected: {component['expected_digest']}\n"
+                                    f"actual: {component['actual_digest']}")
+                elif component['status'] == STATUS_SKIPPED:
+                    ET.SubElement(testcase, 'skipped', message='Component not onboarded in the release')
+            for task in failed_tasks:
+                testcase = ET.SubElement(testsuite, 'testcase', classname=f'{release}.{repo}', name='verification')
+                error = ET.SubElement(testcase, 'error', message='Nudge verification could not be completed')
+                error.text = task['output']
+
+        ET.ElementTree(testsuites).write(file_path, encoding='utf-8', xml_declaration=True)
+
+
+    def write(self, report_format, file_path, wall_time):
+        """
+        Writes the report in the given format, creating its directory if needed.
+
+        Args:
+            - report_format (str): One of 'json' or 'junit'.
+            - file_path (str): The path of the report file.
+            - wall_time (float): The total wall time of the run in seconds.
+        """
+        os.makedirs(os.path.dirname(os.path.abspath(file_path)), exist_ok=True)
+        if report_format == 'junit':
+            self.write_junit(file_path, wall_time)
+        else:
+            self.write_json(file_path, wall_time)
+
+
+    def reset(self):
+        """
+        Drops everything collected so far.
+        """
+        with self._lock:
+            self.components = []
+            self.failed_tasks = []
+
+
+
+# Report shared by the whole process
+report = Report()
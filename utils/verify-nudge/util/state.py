@@ -0,0 +1,186 @@
+import calendar
+import json
+import os
+import threading
+import time
+# local packages
+from util import download_cache
+
+
+DEFAULT_STATE_FILE = os.path.join("downloads", "verify-nudge-state.json")
+
+# Seconds during which the digests resolved by a successful verification are trusted, instead of
+# being resolved again. A tag moved in Quay is noticed at most this long after it moved.
+DEFAULT_REVALIDATE_AFTER = 600
+
+# Status of a (release, repo) verification, only the 'ok' ones can be skipped by a later run
+STATUS_OK = 'ok'
+STATUS_MISMATCH = 'mismatch'
+
+_store = None
+_store_lock = threading.Lock()
+
+
+
+class StateStore:
+    """
+    Persisted state of the previous verifications, keyed by (release, repo).
+
+    Each entry records the content hash of every nudged file of the repo config, the
+    digests the verified image tags resolved to and the outcome of the verification. A
+    later run whose nudged files and digests are unchanged can skip the verification of an
+    entry which was 'ok'. The digests of an 'ok' entry are also trusted for `revalidate_after`
+    seconds since they were resolved, so that they are not looked up again. With `full` the
+    previous entries are ignored, every pair is verified again, but the new entries are still
+    recorded.
+    """
+
+    def __init__(self, file_path=DEFAULT_STATE_FILE, full=False, revalidate_after=DEFAULT_REVALIDATE_AFTER):
+        self.file_path = os.path.abspath(file_path)
+        self.full = full
+        self.revalidate_after = revalidate_after
+        self._lock = threading.Lock()
+        self._changed = set()
+        self._entries = {}
+        try:
+            with open(self.file_path) as file:
+                self._entries = json.load(file).get('entries', {})
+        except (OSError, ValueError, AttributeError):
+            # No usable state yet, everything is verified
+            self._entries = {}
+
+
+    def _key(self, release, repo):
+        return f"{release}/{repo}"
+
+
+    def get(self, release, repo):
+        """
+        Returns the recorded state of a (release, repo) verification.
+
+        Returns:
+            - dict: The entry with 'files', 'digests', 'status' and 'verified_at', or None if
+                    the pair was never verified or `full` is set.
+        """
+        if self.full:
+            return None
+        with self._lock:
+            return self._entries.get(self._key(release, repo))
+
+
+    def is_unchanged(self, release, repo, files, digests):
+        """
+        Checks if a (release, repo) verification was 'ok' with the same nudged files and digests.
+
+        Args:
+            - release (str): The verified release.
+            - repo (str): The name of the repo config.
+            - files (dict): Path of each nudged file -> hash of its content.
+            - digests (dict): '<image>:<tag>' of each verified image -> its resolved digest.
+        """
+        entry = self.get(release, repo)
+        return bool(entry) and entry.get('status') == STATUS_OK and entry.get('files') == files and entry.get('digests') == digests
+
+
+    def get_trusted_digests(self, release, repo, files):
+        """
+        Returns the digests of the last successful verification of a (release, repo) pair, if they
+        were resolved less than `revalidate_after` seconds ago and the nudged files didn't change
+        since. A changed nudged file usually follows a moved tag, its digests are resolved again.
+
+        Args:
+            - release (str): The verified release.
+            - repo (str): The name of the repo config.
+            - files (dict): Path of each nudged file -> hash of its current content.
+
+        Returns:
+            - tuple: '<image>:<tag>' -> digest, empty if nothing can be trusted, and the time
+                     (seconds since the epoch) the digests were resolved at, or None.
+        """
+        entry = self.get(release, repo)
+        if not entry or entry.get('status') != STATUS_OK or entry.get('files') != files:
+            return {}, None
+        resolved_at = entry.get('resolved_at')
+        if resolved_at is None:
+            resolved_at = calendar.timegm(time.strptime(entry['verified_at'], '%Y-%m-%dT%H:%M:%SZ'))
+        if time.time() - resolved_at > self.revalidate_after:
+            return {}, None
+        return entry.get('digests', {}), resolved_at
+
+
+    def record(self, release, repo, files, digests, status, resolved_at=None):
+        """
+        Records the state of a completed (release, repo) verification.
+
+        Args:
+            - release (str): The verified release.
+            - repo (str): The name of the repo config.
+            - files (dict): Path of each nudged file -> hash of its content.
+            - digests (dict): '<image>:<tag>' of each verified image -> its resolved digest.
+            - status (str): One of 'ok' or 'mismatch'.
+            - resolved_at (float): When the oldest of the digests was resolved, now if not set.
+        """
+        with self._lock:
+            previous = self._entries.get(self._key(release, repo))
+            if previous and previous.get('files') != files:
+                self._changed.add((release, repo))
+            self._entries[self._key(release, repo)] = {
+                'files': files,
+                'digests': digests,
+                'status': status,
+                'resolved_at': time.time() if resolved_at is None else resolved_at,
+                'verified_at': time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime())
+            }
+
+
+    def pop_changed(self):
+        """
+        Returns the (release, repo) pairs whose nudged files changed since their previously recorded
+        state, recorded since the last call.
+
+        Returns:
+            - set: The (release, repo) tuples.
+        """
+        with self._lock:
+            changed, self._changed = self._changed, set()
+        return changed
+
+
+    def save(self):
+        """
+        Writes the state file atomically.
+        """
+        with self._lock:
+            content = json.dumps({'entries': self._entries}, indent=4, sort_keys=True)
+        download_cache.write_file_atomically(self.file_path, content.encode())
+
+
+
+def configure(file_path=DEFAULT_STATE_FILE, full=False, revalidate_after=DEFAULT_REVALIDATE_AFTER):
+    """
+    Replaces the state store shared by the process.
+
+    Args:
+        - file_path (str): The path of the state file.
+        - full (bool): If True, the previous state is ignored and every pair is verified.
+        - revalidate_after (float): Seconds during which the digests of a successful verification are trusted.
+    """
+    global _store
+    with _store_lock:
+        _store = StateStore(file_path, full, revalidate_after)
+
+
+
+def get_store():
+    """
+    Returns the state store shared by the process, creating it with the defaults on first use.
+
+    Returns:
+        - StateStore: The shared state store.
+    """
+    global _store
+    if _store is None:
+        with _store_lock:
+            if _store is None:
+                _store = StateStore()
+    return _store
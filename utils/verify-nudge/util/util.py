@@ -1,8 +1,18 @@
+import collections
 import os
-import subprocess
 import requests
 import string
 import yaml
+# local packages
+from util import download_cache
+from util import quay_index
+from util import registry
+
+
+# Digest resolvers of `get_quay_image_sha`
+RESOLVER_QUAY_API = 'quay-api'
+RESOLVER_REGISTRY = 'registry'
+RESOLVERS = [RESOLVER_QUAY_API, RESOLVER_REGISTRY]
 
 
 def colored_print(text, color, isBold=False):
@@ -40,16 +50,21 @@ def colored_print(text, color, isBold=False):
     
     
 
-def download_file(filename, url):
+def download_file_content(filename, url):
     """
-    Downloads a file from a specified URL and saves it to a 'downloads' directory in the current working directory.
+    Downloads a file from a specified URL, saves it to a 'downloads' directory in the current working directory
+    and returns its content.
+
+    The file is served through the shared download cache, which revalidates it with its 
+    ETag/Last-Modified, so an unchanged file costs no body transfer and a changed file is 
+    never served stale. The file is written atomically, concurrent workers can share it.
 
     Args:
         - filename (str): The name of the file to be saved.
         - url (str): The URL from which to download the file.
 
     Returns:
-        - str: The full path to the downloaded file in the 'downloads' directory.
+        - str: The content of the downloaded file.
 
     Raises:
         - requests.exceptions.RequestException: Raised for errors related to the HTTP request, such as connection issues or invalid URLs.
@@ -58,31 +73,16 @@ def download_file(filename, url):
         The program will print an error message and exit with a status code of 1.
     """
     try:
-        # Define the path for the downloads directory in the current directory
-        downloads_dir = os.path.join(os.getcwd(), "downloads")
-        
-        # Create the downloads directory if it doesn't exist
-        if not os.path.exists(downloads_dir):
-            os.makedirs(downloads_dir)
-            
-        # Define the full path for the file in the downloads directory
-        file_path = os.path.join(downloads_dir, filename)
+        # Define the full path for the file in the downloads directory in the current directory
+        file_path = os.path.join(os.getcwd(), "downloads", filename)
         
-        # If the file already exists, return the path to the existing file without downloading it again.
-        if os.path.exists(file_path):
-            return file_path
-            
-        # Download the file
-        response = requests.get(url)
+        # Download the file, or reuse the cached copy if it was not modified
+        content = download_cache.get_cache().fetch(url)
 
-        # Raises an HTTPError if the HTTP request was unsuccessful
-        response.raise_for_status()
-
-        # Write the content of the URL in local file 'release.yaml'
-        with open(file_path, "wb") as file:
-            file.write(response.content)
+        # Write the content of the URL in the local file
+        download_cache.write_file_atomically(file_path, content)
             
-        return file_path
+        return content.decode()
 
     except (requests.exceptions.RequestException, Exception) as e:
         colored_print(f"An unexpected error occurred while downloading '{filename}' from url '{url}'.", "light_red")
@@ -92,6 +92,27 @@ def download_file(filename, url):
 
 
 
+def download_file(filename, url):
+    """
+    Downloads a file from a specified URL and saves it to a 'downloads' directory in the current working directory.
+
+    Args:
+        - filename (str): The name of the file to be saved.
+        - url (str): The URL from which to download the file.
+
+    Returns:
+        - str: The full path to the downloaded file in the 'downloads' directory.
+
+    Raises:
+        - Exception: Any error while downloading the file, see `download_file_content`.
+    
+        The program will print an error message and exit with a status code of 1.
+    """
+    download_file_content(filename, url)
+    return os.path.join(os.getcwd(), "downloads", filename)
+
+
+
 def parse_yaml(file_path, release):
     """
     Performs placeholder substitution, Parses the YAML file
@@ -141,174 +162,147 @@ def parse_yaml(file_path, release):
 
 
 
-def parse_nudged_file(file_path):
+# A nudge parsed from a nudged file, 'source_file' is the path of the nudged file it comes from
+NudgeRecord = collections.namedtuple('NudgeRecord', ['source_file', 'component_name', 'image_name', 'image_sha'])
+
+
+
+def parse_nudge_record(source_file, params_env):
     """
-    Reads a nudged file and stores each line in a list. 
-    
+    Extracts component name, image name, and image SHA digest from a given environment parameter string.
+
     Args:
-      - file_path (str): The path to the file to be read.
-    
+        - source_file (str): The path of the nudged file the parameter comes from.
+        - params_env (str): Environment parameter string in the format 'COMPONENT_NAME=image_reference'.
+
     Returns:
-      - list: A list containing the lines of the file.
-    
+        - NudgeRecord: The record of the nudge, with:
+            - component_name (str): The name of the component extracted from 'params_env'.
+            - image_name (str): The name of the image (without the SHA256 digest).
+            - image_sha (str): The SHA256 digest of the image.
+
     Raises:
-      - Exception: If the file is empty or doesn't exist, the program will print an error message 
+        - Exception: If the image reference doesn't have a SHA digest, the program will print an error message 
                     and exit with a status code of 1.
     """
-    # Initialize an empty list to store the lines
-    params_list = []
+    component_name, _, image = params_env.partition('=')
+    image_name, _, image_sha = image.partition('@')
 
-    try:
-        if os.path.isfile(file_path):
-
-            # Read the file and store each line in the list
-            with open(file_path, 'r') as file:
-                for line in file:
-                    # Strip leading and trailing white spaces
-                    stripped_line = line.strip()
-                    # Only add non-empty lines to the list
-                    if stripped_line:
-                        params_list.append(stripped_line)
-        else:
-            raise Exception(f"Error: The file '{file_path}' does not exist.")
-
-
-        # Check if the list is empty and raise an exception if it is
-        if not params_list:
-            raise Exception(f"Error: The file '{file_path}' is empty.")
-        
-        return params_list
-        
-    except Exception as e:
-        colored_print(f"An error occured while reading the nudged file '{file_path}'", "light_red")
+    # check if image is referenced by sha digest
+    if not image_sha.startswith('sha256'):
+        colored_print(f"Invalid '{source_file}': Unable to extract SHA Digest from '{params_env}'.", "light_red")
         print()
-        colored_print(e, "red")
+        colored_print("Error: The Image reference doesn't have SHA Digest.", "red")
         exit(1)
-    
 
-    
-def extract_nudge_details(component_names, nudged_filename, params_env):
+    return NudgeRecord(source_file, component_name, image_name, image_sha)
+
+
+
+def iter_nudge_records(nudged_files, component_names):
     """
-    Extracts component name, image name, and image SHA digest from a given environment parameter string.
+    Streams the nudges of nudged files, straight from their downloaded content.
 
     Args:
-        - component_names (list): List of component names to be verified
-        - nudged_filename (str): The name of the file which gets nudged.
-        - params_env (str): Environment parameter string in the format 'COMPONENT_NAME=image_reference'.
+        - nudged_files (iterable): Pairs of (source_file, content) of the nudged files.
+        - component_names (set|dict): Names of the components to be verified, all of them if empty.
 
-    Returns:
-        - tuple: A tuple containing:
-            - component_name (str): The name of the component extracted from 'params_env'.
-            - image_name (str): The name of the image (without the registry and SHA256 digest).
-            - image_sha (str): The SHA256 digest of the image.
+    Yields:
+        - NudgeRecord: The record of each nudge to be verified, in the order of the nudged files.
 
     Raises:
-        - Exception: If an error occurs during the extraction process, the program will print an error message 
+        - Exception: If the nudged files are empty, the program will print an error message 
                     and exit with a status code of 1.
     """
-    # Initialize variables to empty strings
-    component_name = image = image_name = image_sha = ""
-    try:
-        component_name = params_env.split('=')[0]
-        
-        if not component_names or component_name in component_names:
-            image = params_env.split('=')[1]
-            
-            # check if image is referenced by sha digest 
-            if '@sha256' in image:
-                image_name = image.split('@')[0]
-                image_sha = image.split('@')[1]
-            else:
-                raise Exception("Error: The Image reference doesn't have SHA Digest.")
-        else:
-            colored_print(f"'[{component_name}]' is not in verify-components list. Skipping nudge verification! ", "yellow")
+    for source_file, content in nudged_files:
+        if not content.strip():
+            colored_print(f"An error occured while reading the nudged file '{source_file}'", "light_red")
             print()
-        
-        return component_name, image_name, image_sha
-    
-    except Exception as e:
-        colored_print(f"Invalid '{nudged_filename}': Unable to extract SHA Digest from '{params_env}'.", "light_red")
-        print()
-        colored_print(e, "red")
-        exit(1)
-        
+            colored_print(f"Error: The file '{source_file}' is empty.", "red")
+            exit(1)
+
+        for line in content.splitlines():
+            # Strip leading and trailing white spaces, skip empty lines
+            params_env = line.strip()
+            if not params_env:
+                continue
+
+            component_name = params_env.partition('=')[0]
+            if component_names and component_name not in component_names:
+                colored_print(f"'[{component_name}]' is not in verify-components list. Skipping nudge verification! ", "yellow")
+                print()
+                continue
+
+            yield parse_nudge_record(source_file, params_env)
+
 
 
 def get_quay_image_sha_using_skopeo(image_name, tag):
     """
-    Retrieves the SHA digest of a specific image tag from Quay.io using the Skopeo tool.
+    Retrieves the SHA digest of a specific image tag from Quay.io, as `skopeo inspect` reports it.
+
+    The digest is read with a single registry v2 manifest HEAD request, see `registry.RegistryClient`, 
+    instead of running 'skopeo inspect | jq | cut' in a shell.
 
     Args:
         - image_name (str): The name of the image repository, including the full path (e.g., quay.io/namespace/repository).
         - tag (str): The specific tag of the image for which the SHA digest is required.
 
     Returns:
-        - str: The SHA digest of the specified image tag.
+        - str: The SHA digest of the specified image tag, without the 'sha256:' prefix.
 
     Raises:
-        - subprocess.CalledProcessError: If an error occurs during the execution of the Skopeo, the program will print an error message 
+        - Exception: If the tag is not found or the registry request fails, the program will print an error message 
                     and exit with a status code of 1.
     """
-
-    command = f"skopeo inspect docker://{image_name}:{tag} | jq -r '.Digest' | cut -d':' -f2"
-    print(command)
     try:
-        result = subprocess.run(
-            command, capture_output=True, text=True, shell=True, check=True
-        )
-        return result.stdout.strip()  # Remove any leading/trailing whitespace
-    except (subprocess.CalledProcessError, Exception) as e:
-        colored_print(f"An unexpected error occurred while executing command: '{command}'", "light_red")
+        digest = registry.registry_client.get_manifest_digest(image_name, tag)
+        if not digest:
+            raise Exception(f"Error: Tag '{tag}' not found in repository '{image_name}'")
+        return digest.split(':')[-1]
+    except (requests.exceptions.RequestException, Exception) as e:
+        colored_print(f"An error occured while fetching image sha for '{image_name}:{tag}'", "light_red")
         print()
         colored_print(e, "red")
         exit(1)
 
 
 
-def get_quay_image_sha(image_name, image_tag):
+def get_quay_image_sha(image_name, image_tag, resolver=RESOLVER_QUAY_API):
     """
     Retrieves the SHA digest of a specific image tag from a Quay.io repository.
 
+    With the 'quay-api' resolver the lookup is answered from the shared repository tag index, 
+    so the tags of a repository are fetched from Quay only once per run, however many tags or 
+    releases of the repository are verified. With the 'registry' resolver every tag is resolved 
+    with one registry v2 manifest HEAD request.
+
     Args:
         - image_name (str): The name of the image repository in Quay.io. This should include the full path including the 'quay.io/' prefix.
         - image_tag (str): The specific tag of the image for which the SHA digest is required.
+        - resolver (str): One of 'quay-api' (default) or 'registry'.
 
     Returns:
         - str: The SHA digest of the specified image tag if found.
 
     Raises:
         - Exception: 
-              - If the 'QUAY_API_TOKEN' environment variable is not set or empty, 
               - if the tag is not found in the repository, 
               - if there is an unexpected JSON structure in the API response.
               
             The program will print an error message and exit with a status code of 1.
     """
     try:
-        image_name=image_name.replace('quay.io/', '')
-        url = f"https://quay.io/api/v1/repository/{image_name}/tag/?specificTag={image_tag}"
-        quay_api_token = "TOKEN" # Maybe a bug, but any arbitrary value works        
-        headers = {
-            "Authorization": f"Bearer {quay_api_token}"
-        }
-
-        response = requests.get(url, headers=headers)
-        response.raise_for_status()
-    
-        tags = response.json()
-        
-        # Adjust based on the actual structure of the JSON response
-        if isinstance(tags, dict):
-            tag_list = tags.get('tags', [])
+        if resolver == RESOLVER_REGISTRY:
+            manifest_digest = registry.registry_client.get_manifest_digest(image_name, image_tag)
         else:
-            raise Exception("Error: Unexpected JSON response structure")
-
+            image_name=image_name.replace('quay.io/', '')
+            manifest_digest = quay_index.tag_index.get_manifest_digest(image_name, image_tag)
         
-        for tag in tag_list:
-            if tag.get('name') == image_tag:
-                return tag.get('manifest_digest')
+        if not manifest_digest:
+            raise Exception(f"Error: Tag '{image_tag}' not found in repository '{image_name}'")
         
-        raise Exception(f"Error: Tag '{image_tag}' not found in repository '{image_name}'")
+        return manifest_digest
 
     except (requests.exceptions.RequestException, Exception) as e:
         colored_print(f"An error occured while fetching image sha for '{image_name}:{image_tag}'", "light_red")
@@ -337,131 +331,3 @@ def get_nudged_file_download_url(repo_url, nudged_file_path, release):
     base_url = repo_url.replace('.git', '').replace('github.com', 'raw.githubusercontent.com')
     download_url = f"{base_url}/{release}/{nudged_file_path}"
     return download_url
-
-
-
-def merge_files_content(files, output_file):
-    """
-    Merges the content of all files in the `files` list into a single output file.
-
-    Args:
-        - files (list): List of file paths to be merged.
-        - output_file (str): output filename where merged content will be saved.
-        
-    Returns:
-        - merged_file_path: The full path to the merged file in the 'downloads' directory.
-    """
-    merged_content = ""
-    
-    # Define the path for the downloads directory in the current directory
-    downloads_dir = os.path.join(os.getcwd(), "downloads")
-    
-    # Create the downloads directory if it doesn't exist
-    if not os.path.exists(downloads_dir):
-        os.makedirs(downloads_dir)
-        
-    # Define the full path for the file in the downloads directory
-    merged_file_path = os.path.join(downloads_dir, output_file)
-    for filename in files:
-        filename = os.path.join(downloads_dir, filename)
-        try:
-            with open(filename, 'r') as file:
-                file_content = file.read()
-                merged_content += file_content
-        except FileNotFoundError as e:
-            colored_print(f"Content Merge Error: Unable to parse '{filename}'. File not found!", "light_red")
-            print()
-            colored_print(e, "red")
-            exit(1)
-        except Exception as e:
-            colored_print(f"Content Merge Error: An unexpected error occurred while parsing '{filename}'.", "light_red")
-            print()
-            colored_print(e, "red")
-            exit(1)
-    
-    # Write the merged content into the output file
-    with open(merged_file_path, 'w') as output:
-        output.write(merged_content)
-        
-    return merged_file_path
-
-def send_slack_notification(quay_sha, image_sha, component_name, image_name):
-    """
-    Constructs a Slack notification message for SHA mismatch and sends it.
-
-    This function identifies discrepancies between the Quay SHA and Image SHA
-    for a specific component and image. It constructs a detailed message and
-    invokes the `sendToSlack` function to deliver the message via Slack.
-
-    Args:
-        quay_sha (str): The SHA digest retrieved from the Quay repository.
-        image_sha (str): The SHA digest retrieved from the image source.
-        component_name (str): The name of the component being validated.
-        image_name (str): The name of the image associated with the component.
-
-    Returns:
-        None
-
-    Raises:
-        Any exceptions from `sendToSlack` will propagate up to the caller.
-    """
-    slack_message = f"""
-    🚨 *Mismatch Detected!*
-    The following SHA values do not match:
-    
-    *Component Name:* `{component_name}`
-    *Image Name:* `{image_name}`
-    *Quay SHA:* `{quay_sha}`
-    *Image SHA:* `{image_sha}`
-    
-    Please investigate this discrepancy.
-    """
-
-    # Send the message to Slack
-    send_to_slack(slack_message)
-
-
-def send_to_slack(message):
-    """
-    Sends a message to a Slack channel using a webhook URL.
-
-    This function posts the given message to Slack via an incoming webhook.
-    The webhook URL is retrieved from the `SLACK_WEBHOOK_URL` environment variable.
-    If the webhook URL is not set or the Slack API returns an error, the function
-    raises appropriate exceptions.
-
-    Args:
-        message (str): The message to be sent to Slack. Should be formatted in
-                       Markdown for better presentation.
-
-    Returns:
-        None
-
-    Raises:
-        EnvironmentError: If the `SLACK_WEBHOOK_URL` environment variable is not set.
-        ValueError: If the Slack API returns a non-200 HTTP status code.
-
-    Example:
-        To send a message:
-        ```python
-        sendToSlack("This is a test message!")
-        ```
-    """
-    webhook_url = os.getenv("SLACK_WEBHOOK")
-
-    if not webhook_url:
-        raise EnvironmentError("SLACK_WEBHOOK is not set in the environment.")
-
-    slack_payload = {
-        "text": message
-    }
-
-    response = requests.post(
-        webhook_url, json=slack_payload,
-        headers={'Content-Type': 'application/json'}
-    )
-
-    if response.status_code != 200:
-        raise ValueError(
-            f"Request to Slack returned an error {response.status_code}, the response is:\n{response.text}"
-    )
\ No newline at end of file
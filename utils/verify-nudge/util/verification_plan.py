@@ -0,0 +1,149 @@
+import functools
+import string
+import yaml
+from packaging.version import Version
+# local packages
+from util import util
+from validator import validator
+
+
+
+@functools.lru_cache(maxsize=None)
+def parse_release_version(release):
+    """
+    Parses a release string in the format 'rhoai-<version>' into a comparable Version, once per release.
+
+    Args:
+        - release (str): The release string, e.g. 'rhoai-2.16'.
+
+    Returns:
+        - packaging.version.Version: The version of the release.
+    """
+    return Version(release.replace('rhoai-', ''))
+
+
+
+def compile_value(value):
+    """
+    Compiles a value of config.yaml into a function of the release, which substitutes the
+    ${release} placeholder in every string holding one and returns everything else as is.
+
+    Args:
+        - value: A value parsed from config.yaml, strings, lists and dicts are walked.
+
+    Returns:
+        - callable: Function returning the value instantiated for a given release.
+    """
+    if isinstance(value, str) and '$' in value:
+        template = string.Template(value)
+        return lambda release: template.substitute(release=release)
+    if isinstance(value, dict):
+        compiled_items = [(key, compile_value(item)) for key, item in value.items()]
+        return lambda release: {key: item(release) for key, item in compiled_items}
+    if isinstance(value, list):
+        compiled_items = [compile_value(item) for item in value]
+        return lambda release: [item(release) for item in compiled_items]
+    return lambda release: value
+
+
+
+class CompiledRepoConfig:
+    """
+    A validated repo config of config.yaml, with its verify-components indexed by name.
+    """
+
+    def __init__(self, config):
+        self.name = config.get('name')
+        self.instantiate = compile_value(config)
+
+        self.onboarded_since = config.get('onboarded-since', '')
+        self.onboarded_version = parse_release_version(self.onboarded_since) if self.onboarded_since else None
+
+        # component name -> (image-tag template, onboarded-since, onboarded-since Version)
+        self.components = {}
+        for component in config.get('verify-components', []):
+            onboarded_since = component.get('onboarded-since', '')
+            self.components[component['name']] = (
+                compile_value(component.get('image-tag', '${release}')),
+                onboarded_since,
+                parse_release_version(onboarded_since) if onboarded_since else None
+            )
+
+
+    def is_onboarded(self, release):
+        """
+        Returns True if the nudging of the repo was enabled in the given release.
+        """
+        return self.onboarded_version is None or parse_release_version(release) >= self.onboarded_version
+
+
+    def for_release(self, release):
+        """
+        Instantiates the repo config for a release.
+
+        Args:
+            - release (str): The release version, e.g. 'rhoai-2.16'.
+
+        Returns:
+            - tuple: A tuple containing:
+                - config (dict): The repo config with ${release} substituted.
+                - components (dict): component name -> (image tag, onboarded-since, onboarded in the release),
+                                     empty if all the components of the nudged files are verified.
+        """
+        release_version = parse_release_version(release)
+        components = {
+            name: (image_tag(release), onboarded_since, onboarded_version is None or release_version >= onboarded_version)
+            for name, (image_tag, onboarded_since, onboarded_version) in self.components.items()
+        }
+        return self.instantiate(release), components
+
+
+
+def compile_config(file_path):
+    """
+    Loads and validates config.yaml once, and compiles each repo config so that it can be
+    instantiated for every release by cheap substitution.
+
+    Args:
+        - file_path (str): The path to config.yaml.
+
+    Returns:
+        - list: The CompiledRepoConfig of each repo config, in the order of config.yaml.
+
+    Raises:
+        - yaml.YAMLError: Raised if there is an error specific to parsing the YAML content.
+        - FileNotFoundError: Raised if the specified file is not found.
+        - Exception: Catches all other exceptions that may occur during file processing.
+
+        The program will print an error message and exit with a status code of 1.
+    """
+    try:
+        with open(file_path, 'r') as file:
+            configs = yaml.safe_load(file)
+
+        compiled_configs = []
+        for config in configs:
+            validator.validate_config_yaml(config)
+            compiled_config = CompiledRepoConfig(config)
+
+            # Instantiate once, so that an invalid placeholder fails here and not in the middle of the verification
+            compiled_config.for_release('rhoai-0.0')
+            compiled_configs.append(compiled_config)
+
+        return compiled_configs
+
+    except yaml.YAMLError as e:
+        util.colored_print(f"YAML error occured while parsing '{file_path}'.", "light_red")
+        print()
+        util.colored_print(e, "red")
+        exit(1)
+    except FileNotFoundError as e:
+        util.colored_print(f"Unable to parse '{file_path}'. File not found!", "light_red")
+        print()
+        util.colored_print(e, "red")
+        exit(1)
+    except Exception as e:
+        util.colored_print(f"An unexpected error occurred while parsing '{file_path}'.", "light_red")
+        print()
+        util.colored_print(e, "red")
+        exit(1)
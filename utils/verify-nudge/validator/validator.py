@@ -1,5 +1,5 @@
 import re
-import util
+from util import util
 
 def validate_release_pattern(release):
     """